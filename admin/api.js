@@ -221,6 +221,25 @@ router.get('/budget', authMiddleware, requireShopId, async (req, res) => {
     }
 });
 
+// Range analytics are computed (and memoized) by the Telegram bot process
+const ANALYTICS_API_URL = process.env.ANALYTICS_API_URL || `http://127.0.0.1:${process.env.ANALYTICS_API_PORT || 5055}/analytics`;
+
+router.get('/analytics', authMiddleware, requireShopId, async (req, res) => {
+    try {
+        const params = new URLSearchParams({ shop_id: String(getShopId(req)) });
+        for (const key of ['days', 'start', 'end']) {
+            if (req.query[key]) {
+                params.set(key, String(req.query[key]));
+            }
+        }
+        const response = await fetch(`${ANALYTICS_API_URL}?${params}`);
+        res.status(response.status).json(await response.json());
+    } catch (err) {
+        console.error('Analytics error:', err);
+        res.status(502).json({ success: false, error: 'Analytics service unavailable' });
+    }
+});
+
 router.post('/budget/transaction', authMiddleware, requireShopId, async (req, res) => {
     try {
         const { amount, service, client } = req.body;
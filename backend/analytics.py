@@ -0,0 +1,175 @@
+"""
+Revenue and utilization analytics over arbitrary date ranges.
+
+Rows come back from db_client already grouped by shop-local day, and are
+folded here into one rollup per day. Rollups for closed days (before the
+shop's today) are memoized, so a historical range is fetched once and later
+requests only touch today. A late write to a closed day, from the bot or the
+admin API, evicts it through the change feed.
+"""
+
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Optional, List, Dict, Tuple
+
+import db_client as db
+from change_feed import subscribe, SALE_RECORDED, APPOINTMENT_BOOKED, APPOINTMENT_CANCELLED, APPOINTMENT_UPDATED
+from shop_clock import ShopDay, range_bounds
+
+SLOTS_PER_DAY = len(db.SLOT_START_TIMES)
+
+# Appointments that did not occupy a barber's slot
+UNSERVED_STATUSES = ('cancelled', 'no_show')
+
+
+@dataclass
+class DayRollup:
+    revenue_cents: int = 0
+    sales: int = 0
+    hourly_cents: List[int] = field(default_factory=lambda: [0] * 24)
+    statuses: Counter = field(default_factory=Counter)
+    barbers: Counter = field(default_factory=Counter)
+    service_counts: Counter = field(default_factory=Counter)
+    service_booked_cents: Counter = field(default_factory=Counter)
+
+    @property
+    def is_open(self) -> bool:
+        """Whether the shop did any business that day."""
+        return self.sales > 0 or any(n for s, n in self.statuses.items() if s != 'cancelled')
+
+
+_closed_days: Dict[Tuple[Optional[int], date], DayRollup] = {}
+
+
+def _dates(start: date, end: date) -> List[date]:
+    return [start + timedelta(days=n) for n in range((end - start).days + 1)]
+
+
+def _fold(rows: Dict, days: Dict[date, DayRollup]):
+    for row in rows['revenue']:
+        rollup = days[row['day']]
+        rollup.revenue_cents += int(row['cents'])
+        rollup.sales += row['sales']
+        rollup.hourly_cents[row['hour']] += int(row['cents'])
+    for row in rows['appointments']:
+        rollup = days[row['day']]
+        rollup.statuses[row['status']] += row['count']
+        if row['status'] not in UNSERVED_STATUSES:
+            rollup.barbers[row['barber']] += row['count']
+        if row['status'] != 'cancelled':
+            rollup.service_counts[row['service']] += row['count']
+            rollup.service_booked_cents[row['service']] += int(row['cents'])
+
+
+async def _rollups(shop_id: Optional[int], start: date, end: date, today: ShopDay) -> Dict[date, DayRollup]:
+    result = {}
+    missing = []
+    for d in _dates(start, end):
+        cached = _closed_days.get((shop_id, d)) if d < today.date else None
+        if cached is not None:
+            result[d] = cached
+        else:
+            missing.append(d)
+
+    if missing:
+        # One bulk fetch spanning every day we don't have yet
+        fetch_start, fetch_end = missing[0], missing[-1]
+        start_bound, end_bound = range_bounds(fetch_start, fetch_end, today.timezone)
+        rows = await db.get_analytics_rows(
+            shop_id, fetch_start, fetch_end, today.timezone, start_bound, end_bound
+        )
+        fresh = {d: DayRollup() for d in _dates(fetch_start, fetch_end)}
+        _fold(rows, fresh)
+        for d, rollup in fresh.items():
+            if d < today.date:
+                _closed_days[(shop_id, d)] = rollup
+            result[d] = rollup
+    return result
+
+
+async def get_analytics(start: date, end: date, shop_id: Optional[int] = db.DEFAULT_SHOP_ID) -> Dict:
+    """Daily/hourly revenue, per-barber utilization, cancel/no-show rates and service mix.
+
+    Utilization is served slots (not cancelled or no-show, up to today) over
+    every slot on the days the shop was open. Service mix values bookings at
+    list price, so it is booked value rather than revenue.
+    """
+    today = await db.get_shop_day(shop_id)
+    rollups = await _rollups(shop_id, start, end, today)
+    dates = _dates(start, end)
+
+    daily = [rollups[d].revenue_cents for d in dates]
+    rolling_7d = []
+    window = 0
+    for i, cents in enumerate(daily):
+        window += cents - (daily[i - 7] if i >= 7 else 0)
+        rolling_7d.append(round(window / min(i + 1, 7)))
+
+    hourly = [0] * 24
+    statuses = Counter()
+    booked = Counter()
+    open_days = 0
+    service_counts = Counter()
+    service_booked_cents = Counter()
+    for d, rollup in rollups.items():
+        for hour, cents in enumerate(rollup.hourly_cents):
+            hourly[hour] += cents
+        statuses.update(rollup.statuses)
+        service_counts.update(rollup.service_counts)
+        service_booked_cents.update(rollup.service_booked_cents)
+        # Future bookings haven't used a slot yet
+        if d <= today.date:
+            booked.update(rollup.barbers)
+            open_days += rollup.is_open
+
+    total_appointments = sum(statuses.values())
+    total_booked = sum(service_counts.values())
+
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'revenue_cents': sum(daily),
+        'sales': sum(r.sales for r in rollups.values()),
+        'daily_revenue': [(d.isoformat(), cents) for d, cents in zip(dates, daily)],
+        'rolling_7d_revenue': rolling_7d,
+        'hourly_revenue': hourly,
+        'appointments': total_appointments,
+        'cancel_rate': statuses['cancelled'] / total_appointments if total_appointments else 0.0,
+        'no_show_rate': statuses['no_show'] / total_appointments if total_appointments else 0.0,
+        'barber_utilization': {
+            barber: {
+                'booked': count,
+                'days': open_days,
+                'utilization': count / (SLOTS_PER_DAY * open_days)
+            }
+            for barber, count in booked.most_common()
+        } if open_days else {},
+        'service_mix': {
+            service: {
+                'count': count,
+                'booked_value_cents': service_booked_cents[service],
+                'share': count / total_booked
+            }
+            for service, count in service_counts.most_common()
+        }
+    }
+
+
+def _evict(days: List[date]):
+    for key in [k for k in _closed_days if k[1] in days]:
+        del _closed_days[key]
+
+
+def _on_change_event(event):
+    payload = event.payload
+    if event.event_type == SALE_RECORDED and payload.get('occurred_at'):
+        # occurred_at is in the database's timezone, so the shop-local day may be either side
+        day = datetime.fromisoformat(payload['occurred_at']).date()
+        _evict([day - timedelta(days=1), day, day + timedelta(days=1)])
+    elif payload.get('appointment_date'):
+        _evict([date.fromisoformat(payload['appointment_date'])])
+
+
+for _event_type in (SALE_RECORDED, APPOINTMENT_BOOKED, APPOINTMENT_CANCELLED, APPOINTMENT_UPDATED):
+    subscribe(_event_type, _on_change_event)
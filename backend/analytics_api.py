@@ -0,0 +1,69 @@
+"""
+Local HTTP endpoint for range analytics.
+
+Served from the bot process so requests share analytics' memoized closed-day
+rollups. It listens on loopback only; the admin API forwards authenticated
+/api/analytics requests here with the caller's shop.
+"""
+
+import os
+from datetime import date, timedelta
+from typing import Optional
+
+from aiohttp import web
+
+import db_client as db
+import analytics
+
+API_HOST = os.environ.get('ANALYTICS_API_HOST', '127.0.0.1')
+API_PORT = int(os.environ.get('ANALYTICS_API_PORT', '5055'))
+MAX_RANGE_DAYS = 366 * 3
+
+_runner: Optional[web.AppRunner] = None
+
+
+def _bad_request(message: str) -> web.Response:
+    return web.json_response({'success': False, 'error': message}, status=400)
+
+
+async def handle_analytics(request: web.Request) -> web.Response:
+    """GET /analytics?shop_id=&days=N or ?start=YYYY-MM-DD&end=YYYY-MM-DD"""
+    query = request.query
+    try:
+        shop_id = int(query['shop_id']) if query.get('shop_id') else db.DEFAULT_SHOP_ID
+        today = (await db.get_shop_day(shop_id)).date
+        if query.get('start'):
+            start = date.fromisoformat(query['start'])
+            end = date.fromisoformat(query['end']) if query.get('end') else today
+        else:
+            end = today
+            start = end - timedelta(days=int(query.get('days', '30')) - 1)
+    except ValueError as e:
+        return _bad_request(f"invalid range: {e}")
+    if start > end or (end - start).days >= MAX_RANGE_DAYS:
+        return _bad_request(f"range must be 1 to {MAX_RANGE_DAYS} days")
+
+    try:
+        stats = await analytics.get_analytics(start, end, shop_id)
+    except db.DatabaseUnavailable as e:
+        return web.json_response({'success': False, 'error': str(e)}, status=503)
+    return web.json_response({'success': True, 'analytics': stats})
+
+
+async def start(host: str = API_HOST, port: int = API_PORT):
+    global _runner
+    if _runner is not None:
+        return
+    app = web.Application()
+    app.router.add_get('/analytics', handle_analytics)
+    _runner = web.AppRunner(app)
+    await _runner.setup()
+    await web.TCPSite(_runner, host, port).start()
+    print(f"Analytics API listening on http://{host}:{port}/analytics")
+
+
+async def stop():
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
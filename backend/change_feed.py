@@ -0,0 +1,212 @@
+"""
+Change feed for writes made through db_client and the admin API.
+
+Each write records a typed event in the change_events outbox within the same
+statement. A trigger turns every insert into a NOTIFY on the change_events
+channel. ChangeFeedDispatcher listens for it, reads events past its stored
+offset, hands them to in-process subscribers and only then advances the
+offset, so delivery is at-least-once. An event whose handlers keep failing is
+logged and skipped after MAX_DELIVERY_ATTEMPTS so it can't block the feed,
+and events older than RETENTION_DAYS are pruned.
+"""
+
+import os
+import json
+import time
+import asyncio
+import inspect
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, List, Dict, Any, Callable
+
+import asyncpg
+
+APPOINTMENT_BOOKED = 'appointment.booked'
+APPOINTMENT_CANCELLED = 'appointment.cancelled'
+APPOINTMENT_UPDATED = 'appointment.updated'
+SALE_RECORDED = 'sale.recorded'
+MESSAGE_POSTED = 'message.posted'
+USER_CREATED = 'user.created'
+QUEUE_JOINED = 'queue.joined'
+QUEUE_CALLED = 'queue.called'
+QUEUE_STARTED = 'queue.started'
+QUEUE_COMPLETED = 'queue.completed'
+QUEUE_NO_SHOW = 'queue.no_show'
+
+CHANNEL = 'change_events'
+MAX_DELIVERY_ATTEMPTS = int(os.environ.get('CHANGE_FEED_MAX_ATTEMPTS', '5'))
+RETENTION_DAYS = int(os.environ.get('CHANGE_EVENT_RETENTION_DAYS', '7'))
+PRUNE_INTERVAL = 3600
+
+
+@dataclass
+class ChangeEvent:
+    id: int
+    event_type: str
+    entity_id: Optional[int]
+    shop_id: Optional[int]
+    payload: Dict[str, Any]
+    created_at: datetime
+
+
+_subscribers: Dict[str, List[Callable]] = {}
+
+
+def with_event(statement: str, event_type: str) -> str:
+    """Wrap an INSERT/UPDATE ... RETURNING * so it also writes an outbox event.
+
+    Both writes happen in one statement, so the event exists exactly when the
+    change does, and the caller still gets the written row back. shop_id is
+    read from the row's JSON so tables without the column still work.
+    """
+    return f"""
+        WITH written AS ({statement}),
+        event AS (
+            INSERT INTO change_events (event_type, entity_id, shop_id, payload)
+            SELECT '{event_type}', id, (to_jsonb(written)->>'shop_id')::int, to_jsonb(written)
+            FROM written
+        )
+        SELECT * FROM written
+    """
+
+
+def subscribe(event_type: str, handler: Callable):
+    """Register handler(event) for an event type, or '*' for every event."""
+    _subscribers.setdefault(event_type, []).append(handler)
+
+
+async def _deliver(event: ChangeEvent):
+    for handler in _subscribers.get(event.event_type, []) + _subscribers.get('*', []):
+        result = handler(event)
+        if inspect.isawaitable(result):
+            await result
+
+
+class ChangeFeedDispatcher:
+    """Fans outbox events out to subscribers for one named consumer.
+
+    A consumer seen for the first time starts at the newest event rather than
+    replaying the whole history.
+    """
+
+    def __init__(self, consumer: str, poll_interval: float = 30, batch_size: int = 100):
+        self.consumer = consumer
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.offset = 0
+        self._attempts: Dict[int, int] = {}
+        self._pruned_at = 0.0
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _on_notify(self, connection, pid, channel, payload):
+        self._wake.set()
+
+    async def _run(self):
+        delay = 1.0
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(os.environ.get('DATABASE_URL'))
+                await conn.add_listener(CHANNEL, self._on_notify)
+                self.offset = await self._load_offset(conn)
+                delay = 1.0
+                while True:
+                    self._wake.clear()
+                    if time.monotonic() - self._pruned_at >= PRUNE_INTERVAL:
+                        await self._prune(conn)
+                    await self._drain(conn)
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Change feed {self.consumer} disconnected: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+            finally:
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+
+    async def _load_offset(self, conn) -> int:
+        return await conn.fetchval("""
+            INSERT INTO change_event_offsets (consumer, last_event_id)
+            VALUES ($1, (SELECT COALESCE(MAX(id), 0) FROM change_events))
+            ON CONFLICT (consumer) DO UPDATE SET consumer = EXCLUDED.consumer
+            RETURNING last_event_id
+        """, self.consumer)
+
+    async def _save_offset(self, conn):
+        await conn.execute("""
+            UPDATE change_event_offsets SET last_event_id = $2, updated_at = NOW()
+            WHERE consumer = $1
+        """, self.consumer, self.offset)
+
+    async def _prune(self, conn):
+        status = await conn.execute(
+            "DELETE FROM change_events WHERE created_at < NOW() - make_interval(days => $1)",
+            RETENTION_DAYS
+        )
+        self._pruned_at = time.monotonic()
+        if status and status != 'DELETE 0':
+            print(f"Change feed pruned events older than {RETENTION_DAYS} days ({status})")
+
+    def _give_up(self, event_id: int, error: Exception) -> bool:
+        """Count a failed delivery; True once the event should be skipped."""
+        attempts = self._attempts.get(event_id, 0) + 1
+        if attempts < MAX_DELIVERY_ATTEMPTS:
+            self._attempts[event_id] = attempts
+            print(f"Change feed {self.consumer} handler failed on event {event_id} "
+                  f"(attempt {attempts}/{MAX_DELIVERY_ATTEMPTS}): {error}")
+            return False
+        self._attempts.pop(event_id, None)
+        return True
+
+    async def _drain(self, conn):
+        while True:
+            rows = await conn.fetch(
+                "SELECT * FROM change_events WHERE id > $1 ORDER BY id LIMIT $2",
+                self.offset, self.batch_size
+            )
+            if not rows:
+                return
+            start_offset = self.offset
+            for row in rows:
+                try:
+                    event = ChangeEvent(
+                        id=row['id'],
+                        event_type=row['event_type'],
+                        entity_id=row['entity_id'],
+                        shop_id=row['shop_id'],
+                        payload=json.loads(row['payload']),
+                        created_at=row['created_at']
+                    )
+                    await _deliver(event)
+                except Exception as e:
+                    if not self._give_up(row['id'], e):
+                        # Leave the failed event unacknowledged; it is retried on the next wake-up
+                        if self.offset != start_offset:
+                            await self._save_offset(conn)
+                        return
+                    print(f"Change feed {self.consumer} skipping event {row['id']} ({row['event_type']}) "
+                          f"after {MAX_DELIVERY_ATTEMPTS} failed attempts: {e}; payload {row['payload']}")
+                self._attempts.pop(row['id'], None)
+                self.offset = row['id']
+            await self._save_offset(conn)
+            if len(rows) < self.batch_size:
+                return
@@ -0,0 +1,32 @@
+// Change-event outbox, shared with the Python bot (backend/change_feed.py).
+// Writes wrapped with withEvent() record a typed event in change_events in the
+// same statement, so the bot's cached views see admin API changes too.
+
+const EVENTS = {
+    APPOINTMENT_BOOKED: 'appointment.booked',
+    APPOINTMENT_CANCELLED: 'appointment.cancelled',
+    APPOINTMENT_UPDATED: 'appointment.updated',
+    SALE_RECORDED: 'sale.recorded',
+    MESSAGE_POSTED: 'message.posted',
+    USER_CREATED: 'user.created',
+    QUEUE_JOINED: 'queue.joined',
+    QUEUE_CALLED: 'queue.called',
+    QUEUE_STARTED: 'queue.started',
+    QUEUE_COMPLETED: 'queue.completed',
+    QUEUE_NO_SHOW: 'queue.no_show'
+};
+
+// Wrap an INSERT/UPDATE ... RETURNING * so it also writes an outbox event;
+// the caller still gets the written rows back.
+function withEvent(statement, eventType) {
+    return `
+        WITH written AS (${statement}),
+        event AS (
+            INSERT INTO change_events (event_type, entity_id, shop_id, payload)
+            SELECT '${eventType}', id, (to_jsonb(written)->>'shop_id')::int, to_jsonb(written)
+            FROM written
+        )
+        SELECT * FROM written`;
+}
+
+module.exports = { EVENTS, withEvent };
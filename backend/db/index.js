@@ -33,9 +33,14 @@ async function initDatabase() {
     const path = require('path');
     
     try {
-        const migrationPath = path.join(__dirname, 'migrations', '001_initial_schema.sql');
-        const sql = fs.readFileSync(migrationPath, 'utf8');
-        await pool.query(sql);
+        // Migrations are idempotent and applied in filename order
+        const migrationsDir = path.join(__dirname, 'migrations');
+        const files = fs.readdirSync(migrationsDir).filter((f) => f.endsWith('.sql')).sort();
+        for (const file of files) {
+            const sql = fs.readFileSync(path.join(migrationsDir, file), 'utf8');
+            await pool.query(sql);
+            console.log(`Applied migration ${file}`);
+        }
         console.log('Database schema initialized successfully');
         return true;
     } catch (err) {
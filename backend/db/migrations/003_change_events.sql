@@ -0,0 +1,50 @@
+-- SmartMirror Database Schema
+-- Migration 003: Change-event outbox for downstream consumers
+
+-- =====================================================
+-- OUTBOX
+-- =====================================================
+
+-- Every bot write records a typed event here in the same statement
+CREATE TABLE IF NOT EXISTS change_events (
+    id BIGSERIAL PRIMARY KEY,
+    event_type VARCHAR(50) NOT NULL,
+    entity_id INTEGER,
+    shop_id INTEGER,
+    payload JSONB NOT NULL DEFAULT '{}',
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Last event each consumer has fully processed
+CREATE TABLE IF NOT EXISTS change_event_offsets (
+    consumer VARCHAR(100) PRIMARY KEY,
+    last_event_id BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+-- shop_id is informational; events must not depend on the tenant schema
+ALTER TABLE change_events DROP CONSTRAINT IF EXISTS change_events_shop_id_fkey;
+
+CREATE INDEX IF NOT EXISTS idx_change_events_type ON change_events(event_type, id);
+
+-- =====================================================
+-- NOTIFY ON INSERT
+-- =====================================================
+
+CREATE OR REPLACE FUNCTION notify_change_event()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('change_events', NEW.id::text);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'change_events_notify') THEN
+        CREATE TRIGGER change_events_notify
+        AFTER INSERT ON change_events
+        FOR EACH ROW EXECUTE FUNCTION notify_change_event();
+    END IF;
+END;
+$$;
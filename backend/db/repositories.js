@@ -1,4 +1,5 @@
 const db = require('./index');
+const { EVENTS, withEvent } = require('./changeEvents');
 const crypto = require('crypto');
 
 const ShopsRepo = {
@@ -327,9 +328,9 @@ const WalkInQueueRepo = {
         const position = positionResult.rows[0].position;
         
         const result = await db.query(
-            `INSERT INTO walk_in_queue 
+            withEvent(`INSERT INTO walk_in_queue 
              (shop_id, customer_id, customer_name, service_id, preferred_barber_id, queue_position)
-             VALUES ($1, $2, $3, $4, $5, $6) RETURNING *`,
+             VALUES ($1, $2, $3, $4, $5, $6) RETURNING *`, EVENTS.QUEUE_JOINED),
             [queueEntry.shop_id, queueEntry.customer_id, queueEntry.customer_name,
              queueEntry.service_id, queueEntry.preferred_barber_id, position]
         );
@@ -338,13 +339,13 @@ const WalkInQueueRepo = {
 
     async callNext(shopId, barberId, mirrorId) {
         const result = await db.query(
-            `UPDATE walk_in_queue 
+            withEvent(`UPDATE walk_in_queue 
              SET status = 'called', assigned_barber_id = $2, assigned_mirror_id = $3, called_time = NOW()
              WHERE id = (
                  SELECT id FROM walk_in_queue 
                  WHERE shop_id = $1 AND status = 'waiting'
                  ORDER BY queue_position LIMIT 1
-             ) RETURNING *`,
+             ) RETURNING *`, EVENTS.QUEUE_CALLED),
             [shopId, barberId, mirrorId]
         );
         return result.rows[0];
@@ -352,8 +353,8 @@ const WalkInQueueRepo = {
 
     async startService(queueId) {
         const result = await db.query(
-            `UPDATE walk_in_queue SET status = 'in_service', service_start_time = NOW()
-             WHERE id = $1 RETURNING *`,
+            withEvent(`UPDATE walk_in_queue SET status = 'in_service', service_start_time = NOW()
+             WHERE id = $1 RETURNING *`, EVENTS.QUEUE_STARTED),
             [queueId]
         );
         return result.rows[0];
@@ -361,8 +362,8 @@ const WalkInQueueRepo = {
 
     async completeService(queueId) {
         const result = await db.query(
-            `UPDATE walk_in_queue SET status = 'completed', service_end_time = NOW()
-             WHERE id = $1 RETURNING *`,
+            withEvent(`UPDATE walk_in_queue SET status = 'completed', service_end_time = NOW()
+             WHERE id = $1 RETURNING *`, EVENTS.QUEUE_COMPLETED),
             [queueId]
         );
         return result.rows[0];
@@ -370,7 +371,7 @@ const WalkInQueueRepo = {
 
     async markNoShow(queueId) {
         const result = await db.query(
-            `UPDATE walk_in_queue SET status = 'no_show' WHERE id = $1 RETURNING *`,
+            withEvent(`UPDATE walk_in_queue SET status = 'no_show' WHERE id = $1 RETURNING *`, EVENTS.QUEUE_NO_SHOW),
             [queueId]
         );
         return result.rows[0];
@@ -469,8 +470,8 @@ const UsersRepo = {
 
     async create(user) {
         const result = await db.query(
-            `INSERT INTO users (shop_id, name, telegram_chat_id, face_descriptor, face_image_path, azure_person_id, created_at)
-             VALUES ($1, $2, $3, $4, $5, $6, NOW()) RETURNING *`,
+            withEvent(`INSERT INTO users (shop_id, name, telegram_chat_id, face_descriptor, face_image_path, azure_person_id, created_at)
+             VALUES ($1, $2, $3, $4, $5, $6, NOW()) RETURNING *`, EVENTS.USER_CREATED),
             [
                 user.shop_id,
                 user.name, 
@@ -610,9 +611,9 @@ const AppointmentsRepo = {
         const startTime = timeSlotToTime[appointment.time_slot] || '12:00';
 
         const result = await db.query(
-            `INSERT INTO appointments 
+            withEvent(`INSERT INTO appointments 
              (shop_id, user_id, service_id, client_name, appointment_date, time_slot, start_time, barber, barber_id, booked_via, booked_by, is_walk_in)
-             VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12) RETURNING *`,
+             VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12) RETURNING *`, EVENTS.APPOINTMENT_BOOKED),
             [
                 appointment.shop_id, appointment.user_id, appointment.service_id, appointment.client_name,
                 appointment.appointment_date, appointment.time_slot, startTime,
@@ -644,8 +645,8 @@ const AppointmentsRepo = {
 
     async cancel(id) {
         const result = await db.query(
-            `UPDATE appointments SET status = 'cancelled', updated_at = NOW() 
-             WHERE id = $1 RETURNING *`,
+            withEvent(`UPDATE appointments SET status = 'cancelled', updated_at = NOW() 
+             WHERE id = $1 RETURNING *`, EVENTS.APPOINTMENT_CANCELLED),
             [id]
         );
         return result.rows[0];
@@ -653,8 +654,8 @@ const AppointmentsRepo = {
 
     async complete(id) {
         const result = await db.query(
-            `UPDATE appointments SET status = 'completed', updated_at = NOW() 
-             WHERE id = $1 RETURNING *`,
+            withEvent(`UPDATE appointments SET status = 'completed', updated_at = NOW() 
+             WHERE id = $1 RETURNING *`, EVENTS.APPOINTMENT_UPDATED),
             [id]
         );
         return result.rows[0];
@@ -662,8 +663,8 @@ const AppointmentsRepo = {
 
     async assignBarber(id, barberId) {
         const result = await db.query(
-            `UPDATE appointments SET barber_id = $1, updated_at = NOW() 
-             WHERE id = $2 RETURNING *`,
+            withEvent(`UPDATE appointments SET barber_id = $1, updated_at = NOW() 
+             WHERE id = $2 RETURNING *`, EVENTS.APPOINTMENT_UPDATED),
             [barberId, id]
         );
         return result.rows[0];
@@ -697,8 +698,8 @@ const TransactionsRepo = {
 
     async create(transaction) {
         const result = await db.query(
-            `INSERT INTO transactions (shop_id, barber_id, appointment_id, user_id, amount_cents, service_name, client_name, payment_method)
-             VALUES ($1, $2, $3, $4, $5, $6, $7, $8) RETURNING *`,
+            withEvent(`INSERT INTO transactions (shop_id, barber_id, appointment_id, user_id, amount_cents, service_name, client_name, payment_method)
+             VALUES ($1, $2, $3, $4, $5, $6, $7, $8) RETURNING *`, EVENTS.SALE_RECORDED),
             [
                 transaction.shop_id, transaction.barber_id,
                 transaction.appointment_id, transaction.user_id, transaction.amount_cents,
@@ -780,8 +781,8 @@ const MessagesRepo = {
     async create(message) {
         const isCommand = message.text.startsWith('/');
         const result = await db.query(
-            `INSERT INTO messages (shop_id, barber_id, user_id, chat_id, sender, text, is_command, is_new)
-             VALUES ($1, $2, $3, $4, $5, $6, $7, true) RETURNING *`,
+            withEvent(`INSERT INTO messages (shop_id, barber_id, user_id, chat_id, sender, text, is_command, is_new)
+             VALUES ($1, $2, $3, $4, $5, $6, $7, true) RETURNING *`, EVENTS.MESSAGE_POSTED),
             [message.shop_id, message.barber_id, message.user_id, message.chat_id, message.sender, message.text, isCommand]
         );
         return result.rows[0];
@@ -1,10 +1,39 @@
 import os
+import json
+import time
 import asyncpg
 import asyncio
+from contextlib import asynccontextmanager
 from datetime import datetime, date
 from typing import Optional, List, Dict, Any
 
+from query_trace import TracedConnection
+from shop_clock import ShopDay, shop_day
+from change_feed import (
+    with_event, subscribe,
+    APPOINTMENT_BOOKED, APPOINTMENT_CANCELLED, SALE_RECORDED, MESSAGE_POSTED, USER_CREATED,
+    QUEUE_JOINED, QUEUE_CALLED, QUEUE_STARTED, QUEUE_COMPLETED
+)
+from db_resilience import (
+    resilient, resilient_read, buffered_write, replay_pending_writes,
+    is_degraded, DatabaseUnavailable, ConnectFailed, TRANSIENT_ERRORS
+)
+
+CONNECT_TIMEOUT = float(os.environ.get('DB_CONNECT_TIMEOUT', '3'))
+MIRROR_SNAPSHOT_TTL = float(os.environ.get('MIRROR_SNAPSHOT_TTL', '5'))
+DEFAULT_SHOP_ID = int(os.environ['SHOP_ID']) if os.environ.get('SHOP_ID') else None
+
+# Bookable hourly slots and their start times
+SLOT_START_TIMES = {
+    'slot_0900': '09:00', 'slot_1000': '10:00', 'slot_1100': '11:00',
+    'slot_1200': '12:00', 'slot_1300': '13:00', 'slot_1400': '14:00',
+    'slot_1500': '15:00', 'slot_1600': '16:00', 'slot_1700': '17:00'
+}
+
 pool: Optional[asyncpg.Pool] = None
+_snapshot_cache: Dict[tuple, tuple] = {}
+_shop_days: Dict[Optional[int], ShopDay] = {}
+_resolved_shop_ids: Dict[Optional[int], int] = {}
 
 async def init_pool():
     global pool
@@ -12,145 +41,228 @@ async def init_pool():
         database_url = os.environ.get('DATABASE_URL')
         if not database_url:
             raise ValueError("DATABASE_URL environment variable not set")
-        pool = await asyncpg.create_pool(database_url, min_size=2, max_size=10)
+        pool = await asyncpg.create_pool(
+            database_url, min_size=2, max_size=10, timeout=CONNECT_TIMEOUT,
+            connection_class=TracedConnection
+        )
         print("Database pool initialized")
     return pool
 
+@asynccontextmanager
+async def acquire():
+    """Check out a pooled connection; failing to get one raises ConnectFailed."""
+    try:
+        await init_pool()
+        conn = await pool.acquire()
+    except TRANSIENT_ERRORS as e:
+        raise ConnectFailed(str(e) or type(e).__name__) from e
+    try:
+        yield conn
+    finally:
+        await pool.release(conn)
+
+def shop_filter(param: str, column: str = 'shop_id') -> str:
+    """The one shop-scoping rule for every read: all rows when no shop is
+    configured, otherwise that shop's rows plus legacy rows with no shop."""
+    return f"({param}::int IS NULL OR {column} = {param} OR {column} IS NULL)"
+
 async def close_pool():
     global pool
     if pool:
         await pool.close()
         pool = None
 
-async def get_services(active_only: bool = True) -> List[Dict]:
-    await init_pool()
-    query = "SELECT * FROM services WHERE is_active = true ORDER BY name" if active_only else "SELECT * FROM services ORDER BY name"
-    async with pool.acquire() as conn:
-        rows = await conn.fetch(query)
+@resilient_read
+async def get_services(active_only: bool = True, shop_id: Optional[int] = DEFAULT_SHOP_ID) -> List[Dict]:
+    active = "is_active = true AND " if active_only else ""
+    query = f"SELECT * FROM services WHERE {active}{shop_filter('$1')} ORDER BY name"
+    async with acquire() as conn:
+        rows = await conn.fetch(query, shop_id)
         return [dict(row) for row in rows]
 
+@resilient_read
 async def get_service_by_id(service_id: int) -> Optional[Dict]:
-    await init_pool()
-    async with pool.acquire() as conn:
+    async with acquire() as conn:
         row = await conn.fetchrow("SELECT * FROM services WHERE id = $1", service_id)
         return dict(row) if row else None
 
-async def get_appointments_by_date(appt_date: str) -> List[Dict]:
-    await init_pool()
-    async with pool.acquire() as conn:
-        rows = await conn.fetch("""
+@resilient_read
+async def get_appointments_by_date(appt_date: date, shop_id: Optional[int] = DEFAULT_SHOP_ID) -> List[Dict]:
+    async with acquire() as conn:
+        rows = await conn.fetch(f"""
             SELECT a.*, s.name as service_name, s.price_cents 
             FROM appointments a 
             LEFT JOIN services s ON a.service_id = s.id
             WHERE a.appointment_date = $1 AND a.status = 'scheduled'
+              AND {shop_filter('$2', 'a.shop_id')}
             ORDER BY a.start_time
-        """, appt_date)
+        """, appt_date, shop_id)
         return [dict(row) for row in rows]
 
-async def check_appointment_conflict(appt_date: str, time_slot: str) -> bool:
-    await init_pool()
-    async with pool.acquire() as conn:
-        row = await conn.fetchrow("""
+@resilient_read
+async def check_appointment_conflict(
+    appt_date: date,
+    time_slot: str,
+    shop_id: Optional[int] = DEFAULT_SHOP_ID
+) -> bool:
+    async with acquire() as conn:
+        row = await conn.fetchrow(f"""
             SELECT id FROM appointments 
             WHERE appointment_date = $1 AND time_slot = $2 AND status = 'scheduled'
-        """, appt_date, time_slot)
+              AND {shop_filter('$3')}
+        """, appt_date, time_slot, shop_id)
         return row is not None
 
+@resilient
 async def create_appointment(
     client_name: str,
     service_id: int,
-    appt_date: str,
+    appt_date: date,
     time_slot: str,
     booked_by: str,
     user_id: Optional[int] = None,
-    barber: str = "Any"
-) -> Dict:
-    await init_pool()
-    
-    time_slot_to_time = {
-        'slot_0900': '09:00', 'slot_1000': '10:00', 'slot_1100': '11:00',
-        'slot_1200': '12:00', 'slot_1300': '13:00', 'slot_1400': '14:00',
-        'slot_1500': '15:00', 'slot_1600': '16:00', 'slot_1700': '17:00'
-    }
-    start_time = time_slot_to_time.get(time_slot, '12:00')
+    barber: str = "Any",
+    shop_id: Optional[int] = DEFAULT_SHOP_ID
+) -> Optional[Dict]:
+    """Book the slot, or return None if it is already taken.
+
+    Not buffered while the database is down: a queued booking could not be
+    checked against the slot and would double-book it on replay.
+    """
+    start_time = SLOT_START_TIMES.get(time_slot, '12:00')
+    shop_id = await resolve_shop_id(shop_id)
     
-    async with pool.acquire() as conn:
-        row = await conn.fetchrow("""
-            INSERT INTO appointments 
-            (user_id, service_id, client_name, appointment_date, time_slot, start_time, barber, booked_via, booked_by)
-            VALUES ($1, $2, $3, $4, $5, $6, $7, 'telegram', $8) 
+    async with acquire() as conn:
+        async with conn.transaction():
+            # Serialise bookings for the same slot so the conflict check holds
+            await conn.execute(
+                "SELECT pg_advisory_xact_lock(hashtext('appointments'), hashtext(($1::date)::text || $2))",
+                appt_date, time_slot
+            )
+            row = await conn.fetchrow(with_event(f"""
+                INSERT INTO appointments 
+                (user_id, service_id, client_name, appointment_date, time_slot, start_time, barber, booked_via, booked_by, shop_id)
+                SELECT $1, $2, $3, $4, $5, $6, $7, 'telegram', $8, $9
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM appointments
+                    WHERE appointment_date = $4 AND time_slot = $5 AND status = 'scheduled'
+                      AND {shop_filter('$9')}
+                )
+                RETURNING *
+            """, APPOINTMENT_BOOKED), user_id, service_id, client_name, appt_date, time_slot, start_time, barber, booked_by, shop_id)
+    if row is None:
+        return None
+    invalidate_mirror_snapshot()
+    return dict(row)
+
+@buffered_write(stamp='cancelled_at')
+async def cancel_appointment(appointment_id: int, cancelled_at: Optional[datetime] = None) -> Optional[Dict]:
+    async with acquire() as conn:
+        row = await conn.fetchrow(with_event("""
+            UPDATE appointments SET status = 'cancelled', updated_at = COALESCE($2::timestamptz, NOW())
+            WHERE id = $1 AND status = 'scheduled'
             RETURNING *
-        """, user_id, service_id, client_name, appt_date, time_slot, start_time, barber, booked_by)
-        return dict(row)
+        """, APPOINTMENT_CANCELLED), appointment_id, cancelled_at)
+    invalidate_mirror_snapshot()
+    return dict(row) if row else None
 
+@buffered_write(stamp='sent_at')
 async def log_message(
     chat_id: int,
     sender: str,
     text: str,
-    user_id: Optional[int] = None
+    user_id: Optional[int] = None,
+    sent_at: Optional[datetime] = None,
+    shop_id: Optional[int] = DEFAULT_SHOP_ID
 ) -> Dict:
-    await init_pool()
     is_command = text.startswith('/')
-    async with pool.acquire() as conn:
-        row = await conn.fetchrow("""
-            INSERT INTO messages (user_id, chat_id, sender, text, is_command, is_new)
-            VALUES ($1, $2, $3, $4, $5, true) RETURNING *
-        """, user_id, chat_id, sender, text, is_command)
-        return dict(row)
+    shop_id = await resolve_shop_id(shop_id)
+    async with acquire() as conn:
+        row = await conn.fetchrow(with_event("""
+            INSERT INTO messages (user_id, chat_id, sender, text, is_command, is_new, sent_at, shop_id)
+            VALUES ($1, $2, $3, $4, $5, true, COALESCE($6::timestamptz, NOW()), $7) RETURNING *
+        """, MESSAGE_POSTED), user_id, chat_id, sender, text, is_command, sent_at, shop_id)
+    invalidate_mirror_snapshot()
+    return dict(row)
 
-async def get_new_messages() -> List[Dict]:
-    await init_pool()
-    async with pool.acquire() as conn:
-        rows = await conn.fetch("""
+@resilient_read
+async def get_new_messages(shop_id: Optional[int] = DEFAULT_SHOP_ID) -> List[Dict]:
+    async with acquire() as conn:
+        rows = await conn.fetch(f"""
             SELECT * FROM messages WHERE is_new = true AND is_command = false 
+              AND {shop_filter('$1')}
             ORDER BY sent_at DESC
-        """)
+        """, shop_id)
         return [dict(row) for row in rows]
 
+@resilient_read
 async def get_user_by_chat_id(chat_id: int) -> Optional[Dict]:
-    await init_pool()
-    async with pool.acquire() as conn:
+    async with acquire() as conn:
         row = await conn.fetchrow("SELECT * FROM users WHERE telegram_chat_id = $1", chat_id)
         return dict(row) if row else None
 
-async def create_user(name: str, telegram_chat_id: Optional[int] = None) -> Dict:
-    await init_pool()
-    async with pool.acquire() as conn:
-        row = await conn.fetchrow("""
-            INSERT INTO users (name, telegram_chat_id, created_at)
-            VALUES ($1, $2, NOW()) RETURNING *
-        """, name, telegram_chat_id)
+@resilient_read
+async def get_top_customers(limit: int = 10, shop_id: Optional[int] = DEFAULT_SHOP_ID) -> List[Dict]:
+    async with acquire() as conn:
+        rows = await conn.fetch(
+            f"SELECT * FROM users WHERE {shop_filter('$1')} ORDER BY recognition_count DESC LIMIT $2",
+            shop_id, limit
+        )
+        return [dict(row) for row in rows]
+
+@resilient
+async def create_user(
+    name: str,
+    telegram_chat_id: Optional[int] = None,
+    shop_id: Optional[int] = DEFAULT_SHOP_ID
+) -> Dict:
+    shop_id = await resolve_shop_id(shop_id)
+    async with acquire() as conn:
+        row = await conn.fetchrow(with_event("""
+            INSERT INTO users (name, telegram_chat_id, created_at, shop_id)
+            VALUES ($1, $2, NOW(), $3) RETURNING *
+        """, USER_CREATED), name, telegram_chat_id, shop_id)
         return dict(row)
 
+@buffered_write(stamp='occurred_at')
 async def add_transaction(
     amount_cents: int,
     service_name: str,
     client_name: str,
     appointment_id: Optional[int] = None,
-    user_id: Optional[int] = None
+    user_id: Optional[int] = None,
+    occurred_at: Optional[datetime] = None,
+    shop_id: Optional[int] = DEFAULT_SHOP_ID
 ) -> Dict:
-    await init_pool()
-    async with pool.acquire() as conn:
-        row = await conn.fetchrow("""
-            INSERT INTO transactions (appointment_id, user_id, amount_cents, service_name, client_name)
-            VALUES ($1, $2, $3, $4, $5) RETURNING *
-        """, appointment_id, user_id, amount_cents, service_name, client_name)
-        return dict(row)
+    shop_id = await resolve_shop_id(shop_id)
+    async with acquire() as conn:
+        row = await conn.fetchrow(with_event("""
+            INSERT INTO transactions (appointment_id, user_id, amount_cents, service_name, client_name, occurred_at, shop_id)
+            VALUES ($1, $2, $3, $4, $5, COALESCE($6::timestamptz, NOW()), $7) RETURNING *
+        """, SALE_RECORDED), appointment_id, user_id, amount_cents, service_name, client_name, occurred_at, shop_id)
+    invalidate_mirror_snapshot()
+    return dict(row)
 
-async def get_budget_summary() -> Dict:
-    await init_pool()
-    async with pool.acquire() as conn:
-        weekly = await conn.fetchrow("""
-            SELECT COALESCE(SUM(amount_cents), 0) as total 
-            FROM transactions 
-            WHERE occurred_at >= DATE_TRUNC('week', CURRENT_DATE)
-        """)
-        monthly = await conn.fetchrow("""
-            SELECT COALESCE(SUM(amount_cents), 0) as total 
+@resilient_read
+async def get_budget_summary(
+    week_start: datetime,
+    month_start: datetime,
+    shop_id: Optional[int] = DEFAULT_SHOP_ID
+) -> Dict:
+    async with acquire() as conn:
+        earned = await conn.fetchrow(f"""
+            SELECT
+                COALESCE(SUM(amount_cents) FILTER (WHERE occurred_at >= $1::timestamptz), 0) as week,
+                COALESCE(SUM(amount_cents) FILTER (WHERE occurred_at >= $2::timestamptz), 0) as month
             FROM transactions 
-            WHERE occurred_at >= DATE_TRUNC('month', CURRENT_DATE)
-        """)
-        targets = await conn.fetch("SELECT * FROM budget_targets")
+            WHERE occurred_at >= LEAST($1::timestamptz, $2::timestamptz)
+              AND {shop_filter('$3')}
+        """, week_start, month_start, shop_id)
+        # The shop's own targets win over legacy unscoped ones
+        targets = await conn.fetch(
+            f"SELECT * FROM budget_targets WHERE {shop_filter('$1')} ORDER BY shop_id NULLS LAST",
+            shop_id
+        )
         
         weekly_target = next((t for t in targets if t['period'] == 'weekly'), None)
         monthly_target = next((t for t in targets if t['period'] == 'monthly'), None)
@@ -158,15 +270,314 @@ async def get_budget_summary() -> Dict:
         return {
             'weekly_goal': weekly_target['goal_cents'] if weekly_target else 200000,
             'monthly_goal': monthly_target['goal_cents'] if monthly_target else 800000,
-            'current_week_earned': int(weekly['total']),
-            'current_month_earned': int(monthly['total'])
+            'current_week_earned': int(earned['week']),
+            'current_month_earned': int(earned['month'])
         }
 
-async def get_recent_transactions(limit: int = 20) -> List[Dict]:
-    await init_pool()
-    async with pool.acquire() as conn:
+@resilient_read
+async def get_transactions_between(
+    start: datetime,
+    end: datetime,
+    shop_id: Optional[int] = DEFAULT_SHOP_ID
+) -> List[Dict]:
+    async with acquire() as conn:
+        rows = await conn.fetch(f"""
+            SELECT * FROM transactions
+            WHERE occurred_at >= $1::timestamptz AND occurred_at < $2::timestamptz
+              AND {shop_filter('$3')}
+            ORDER BY occurred_at DESC
+        """, start, end, shop_id)
+        return [dict(row) for row in rows]
+
+@resilient_read
+async def get_staff_chat_ids(shop_id: Optional[int] = DEFAULT_SHOP_ID) -> List[int]:
+    async with acquire() as conn:
+        rows = await conn.fetch(f"""
+            SELECT DISTINCT telegram_chat_id FROM barbers
+            WHERE is_active = true AND telegram_chat_id IS NOT NULL
+              AND {shop_filter('$1')}
+        """, shop_id)
+        return [row['telegram_chat_id'] for row in rows]
+
+@resilient_read
+async def get_shop_timezone(shop_id: Optional[int] = None) -> Optional[str]:
+    async with acquire() as conn:
+        return await conn.fetchval("""
+            SELECT timezone FROM shops
+            WHERE $1::int IS NULL OR id = $1
+            ORDER BY id LIMIT 1
+        """, shop_id)
+
+async def get_shop_day(shop_id: Optional[int] = DEFAULT_SHOP_ID) -> ShopDay:
+    """Shop-local day/week/month bounds, cached until the shop's day rolls over."""
+    day = _shop_days.get(shop_id)
+    if day is not None and datetime.now(day.day_end.tzinfo) < day.day_end:
+        return day
+    try:
+        timezone = await get_shop_timezone(shop_id)
+    except Exception as e:
+        print(f"Error loading shop timezone: {e}")
+        if day is None:
+            # Only a guess (SHOP_TIMEZONE); don't keep it past this call
+            return shop_day(shop_id, None)
+        timezone = day.timezone
+    day = shop_day(shop_id, timezone)
+    _shop_days[shop_id] = day
+    return day
+
+@resilient_read
+async def get_recent_transactions(limit: int = 20, shop_id: Optional[int] = DEFAULT_SHOP_ID) -> List[Dict]:
+    async with acquire() as conn:
         rows = await conn.fetch(
-            "SELECT * FROM transactions ORDER BY occurred_at DESC LIMIT $1",
-            limit
+            f"SELECT * FROM transactions WHERE {shop_filter('$2')} ORDER BY occurred_at DESC LIMIT $1",
+            limit, shop_id
         )
         return [dict(row) for row in rows]
+
+MIRROR_SNAPSHOT_QUERY = f"""
+    WITH appts AS (
+        SELECT a.id, a.client_name, a.time_slot, a.start_time, a.barber,
+               s.name AS service_name, s.price_cents
+        FROM appointments a
+        LEFT JOIN services s ON a.service_id = s.id
+        WHERE a.appointment_date = $2 AND a.status = 'scheduled'
+          AND {shop_filter('$1', 'a.shop_id')}
+        ORDER BY a.start_time
+    ),
+    earned AS (
+        SELECT
+            COALESCE(SUM(amount_cents) FILTER (WHERE occurred_at >= $4::timestamptz), 0) AS today,
+            COALESCE(SUM(amount_cents) FILTER (WHERE occurred_at >= $5::timestamptz), 0) AS week,
+            COALESCE(SUM(amount_cents) FILTER (WHERE occurred_at >= $6::timestamptz), 0) AS month
+        FROM transactions
+        WHERE occurred_at >= LEAST($5::timestamptz, $6::timestamptz)
+          AND occurred_at < $7::timestamptz
+          AND {shop_filter('$1')}
+    ),
+    targets AS (
+        SELECT
+            (ARRAY_AGG(goal_cents ORDER BY shop_id NULLS LAST) FILTER (WHERE period = 'weekly'))[1] AS weekly,
+            (ARRAY_AGG(goal_cents ORDER BY shop_id NULLS LAST) FILTER (WHERE period = 'monthly'))[1] AS monthly
+        FROM budget_targets
+        WHERE {shop_filter('$1')}
+    ),
+    msgs AS (
+        SELECT id, sender, text, sent_at
+        FROM messages
+        WHERE is_new = true AND is_command = false
+          AND {shop_filter('$1')}
+        ORDER BY sent_at DESC
+        LIMIT $3
+    )
+    SELECT
+        (SELECT COALESCE(json_agg(appts), '[]'::json) FROM appts) AS appointments,
+        (SELECT COALESCE(json_agg(msgs), '[]'::json) FROM msgs) AS messages,
+        earned.today, earned.week, earned.month,
+        targets.weekly AS weekly_goal, targets.monthly AS monthly_goal
+    FROM earned, targets
+"""
+
+def invalidate_mirror_snapshot():
+    _snapshot_cache.clear()
+
+# Writes from other bot processes reach this one through the change feed
+subscribe('*', lambda event: invalidate_mirror_snapshot())
+
+@resilient_read
+async def get_mirror_snapshot(day: ShopDay, message_limit: int = 20) -> Dict:
+    """Everything the mirror display needs for one shop-local day, in a single query.
+
+    Results are cached for MIRROR_SNAPSHOT_TTL seconds and dropped whenever
+    the bot writes, so repeated refreshes usually cost no query at all.
+    """
+    key = (day.shop_id, day.date, message_limit)
+    cached = _snapshot_cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+
+    async with acquire() as conn:
+        row = await conn.fetchrow(
+            MIRROR_SNAPSHOT_QUERY, day.shop_id, day.date, message_limit,
+            day.day_start, day.week_start, day.month_start, day.day_end
+        )
+
+    snapshot = {
+        'shop_id': day.shop_id,
+        'date': day.date.isoformat(),
+        'appointments': json.loads(row['appointments']),
+        'messages': json.loads(row['messages']),
+        'budget': {
+            'weekly_goal': row['weekly_goal'] or 200000,
+            'monthly_goal': row['monthly_goal'] or 800000,
+            'today_earned': int(row['today']),
+            'current_week_earned': int(row['week']),
+            'current_month_earned': int(row['month'])
+        },
+        'generated_at': datetime.now().isoformat()
+    }
+    _snapshot_cache[key] = (time.monotonic() + MIRROR_SNAPSHOT_TTL, snapshot)
+    return snapshot
+
+@resilient_read
+async def resolve_shop_id(shop_id: Optional[int] = DEFAULT_SHOP_ID) -> Optional[int]:
+    """The configured shop, or the first one; cached since shops are not renumbered."""
+    if shop_id in _resolved_shop_ids:
+        return _resolved_shop_ids[shop_id]
+    async with acquire() as conn:
+        resolved = await conn.fetchval(
+            "SELECT id FROM shops WHERE $1::int IS NULL OR id = $1 ORDER BY id LIMIT 1",
+            shop_id
+        )
+    if resolved is not None:
+        _resolved_shop_ids[shop_id] = resolved
+    return resolved
+
+@resilient_read
+async def get_barber_by_chat_id(chat_id: int) -> Optional[Dict]:
+    async with acquire() as conn:
+        row = await conn.fetchrow(
+            "SELECT * FROM barbers WHERE telegram_chat_id = $1 AND is_active = true",
+            chat_id
+        )
+        return dict(row) if row else None
+
+@resilient_read
+async def get_walk_in_queue(shop_id: int, day: ShopDay) -> Dict:
+    """Today's open queue entries plus how many barbers are clocked in."""
+    async with acquire() as conn:
+        rows = await conn.fetch("""
+            SELECT wq.*, s.name AS service_name,
+                   EXTRACT(EPOCH FROM NOW() - wq.service_start_time) AS elapsed_seconds
+            FROM walk_in_queue wq
+            LEFT JOIN services s ON wq.service_id = s.id
+            WHERE wq.shop_id = $1 AND wq.status IN ('waiting', 'called', 'in_service')
+              AND wq.check_in_time >= $2::timestamptz
+            ORDER BY wq.queue_position
+        """, shop_id, day.day_start)
+        barbers_on_shift = await conn.fetchval("""
+            SELECT COUNT(DISTINCT ms.barber_id)
+            FROM mirror_sessions ms
+            JOIN barbers b ON ms.barber_id = b.id
+            WHERE b.shop_id = $1 AND ms.is_active = true
+        """, shop_id)
+        return {
+            'entries': [dict(row) for row in rows],
+            'barbers_on_shift': int(barbers_on_shift or 0)
+        }
+
+@resilient
+async def enqueue_walk_in(
+    shop_id: int,
+    customer_name: str,
+    day: ShopDay,
+    service_id: Optional[int] = None,
+    preferred_barber_id: Optional[int] = None,
+    customer_id: Optional[int] = None
+) -> Dict:
+    async with acquire() as conn:
+        async with conn.transaction():
+            # Serialise position assignment per shop; the MAX below then sees
+            # every entry committed before us
+            await conn.execute("SELECT pg_advisory_xact_lock(hashtext('walk_in_queue'), $1)", shop_id)
+            row = await conn.fetchrow(with_event("""
+                INSERT INTO walk_in_queue
+                (shop_id, customer_id, customer_name, service_id, preferred_barber_id, queue_position)
+                SELECT $1, $2, $3, $4, $5, COALESCE(MAX(queue_position), 0) + 1
+                FROM walk_in_queue
+                WHERE shop_id = $1 AND status IN ('waiting', 'called')
+                  AND check_in_time >= $6::timestamptz
+                RETURNING *
+            """, QUEUE_JOINED), shop_id, customer_id, customer_name, service_id, preferred_barber_id, day.day_start)
+    return dict(row)
+
+@resilient
+async def call_next_walk_in(
+    shop_id: int,
+    day: ShopDay,
+    barber_id: Optional[int] = None,
+    mirror_id: Optional[int] = None
+) -> Optional[Dict]:
+    """Claim the first waiting customer; concurrent barbers skip rows already being claimed."""
+    async with acquire() as conn:
+        row = await conn.fetchrow(with_event("""
+            UPDATE walk_in_queue
+            SET status = 'called', assigned_barber_id = $2, assigned_mirror_id = $3, called_time = NOW()
+            WHERE id = (
+                SELECT id FROM walk_in_queue
+                WHERE shop_id = $1 AND status = 'waiting'
+                  AND check_in_time >= $4::timestamptz
+                  AND (preferred_barber_id IS NULL OR preferred_barber_id = $2::int)
+                ORDER BY queue_position
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            ) AND status = 'waiting'
+            RETURNING *
+        """, QUEUE_CALLED), shop_id, barber_id, mirror_id, day.day_start)
+    return dict(row) if row else None
+
+@resilient
+async def start_walk_in_service(queue_id: int, barber_id: Optional[int] = None) -> Optional[Dict]:
+    async with acquire() as conn:
+        row = await conn.fetchrow(with_event("""
+            UPDATE walk_in_queue
+            SET status = 'in_service', service_start_time = NOW(),
+                assigned_barber_id = COALESCE(assigned_barber_id, $2)
+            WHERE id = $1 AND status IN ('waiting', 'called')
+            RETURNING *
+        """, QUEUE_STARTED), queue_id, barber_id)
+    return dict(row) if row else None
+
+@resilient
+async def complete_walk_in_service(queue_id: int) -> Optional[Dict]:
+    async with acquire() as conn:
+        row = await conn.fetchrow(with_event("""
+            UPDATE walk_in_queue
+            SET status = 'completed', service_end_time = NOW()
+            WHERE id = $1 AND status = 'in_service'
+            RETURNING *
+        """, QUEUE_COMPLETED), queue_id)
+    return dict(row) if row else None
+
+@resilient_read
+async def get_analytics_rows(
+    shop_id: Optional[int],
+    start: date,
+    end: date,
+    timezone: str,
+    start_bound: datetime,
+    end_bound: datetime
+) -> Dict:
+    """Pre-grouped revenue and appointment rows for the analytics rollups.
+
+    Transactions are bucketed by shop-local day and hour; appointments by
+    day, status, barber and service. Both come back in one pool checkout.
+    """
+    async with acquire() as conn:
+        revenue = await conn.fetch(f"""
+            SELECT local_at::date AS day, EXTRACT(HOUR FROM local_at)::int AS hour,
+                   SUM(amount_cents) AS cents, COUNT(*) AS sales
+            FROM (
+                SELECT amount_cents, occurred_at::timestamptz AT TIME ZONE $2 AS local_at
+                FROM transactions
+                WHERE occurred_at >= $3::timestamptz AND occurred_at < $4::timestamptz
+                  AND {shop_filter('$1')}
+            ) t
+            GROUP BY 1, 2
+        """, shop_id, timezone, start_bound, end_bound)
+        appointments = await conn.fetch(f"""
+            SELECT a.appointment_date AS day, a.status,
+                   COALESCE(b.name, a.barber, 'Any') AS barber,
+                   COALESCE(s.name, 'Other') AS service,
+                   COUNT(*) AS count,
+                   COALESCE(SUM(s.price_cents), 0) AS cents
+            FROM appointments a
+            LEFT JOIN barbers b ON a.barber_id = b.id
+            LEFT JOIN services s ON a.service_id = s.id
+            WHERE a.appointment_date BETWEEN $2 AND $3
+              AND {shop_filter('$1', 'a.shop_id')}
+            GROUP BY 1, 2, 3, 4
+        """, shop_id, start, end)
+        return {
+            'revenue': [dict(row) for row in revenue],
+            'appointments': [dict(row) for row in appointments]
+        }
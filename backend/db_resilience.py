@@ -0,0 +1,266 @@
+"""
+Resilience for db_client calls.
+
+Transient connection errors are retried with bounded exponential backoff. A
+circuit breaker fails fast while Postgres is down instead of letting every tap
+wait on a connect timeout. Reads fall back to their last-known-good result and
+writes are appended to a local durable queue that is replayed on recovery.
+
+Writes are not idempotent, so they are only retried or queued when the
+failure happened before a statement was sent (ConnectFailed, or the breaker
+being open). A connection lost mid-statement may or may not have committed,
+and is reported to the caller instead of being run a second time.
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import inspect
+import functools
+from collections import OrderedDict
+from datetime import datetime, date, timezone
+from typing import Optional, Dict, Any, Callable
+
+import asyncpg
+
+RETRY_ATTEMPTS = int(os.environ.get('DB_RETRY_ATTEMPTS', '3'))
+RETRY_BASE_DELAY = float(os.environ.get('DB_RETRY_BASE_DELAY', '0.2'))
+BREAKER_THRESHOLD = int(os.environ.get('DB_BREAKER_THRESHOLD', '3'))
+BREAKER_RESET_SECONDS = float(os.environ.get('DB_BREAKER_RESET_SECONDS', '15'))
+LAST_GOOD_MAX_ENTRIES = int(os.environ.get('DB_LAST_GOOD_MAX_ENTRIES', '64'))
+PENDING_WRITES_FILE = os.path.join(os.path.dirname(__file__), "pending_writes.jsonl")
+
+TRANSIENT_ERRORS = (
+    asyncpg.exceptions.PostgresConnectionError,
+    asyncpg.exceptions.CannotConnectNowError,
+    asyncpg.exceptions.TooManyConnectionsError,
+    asyncpg.exceptions.InterfaceError,
+    OSError,
+    asyncio.TimeoutError,
+)
+
+
+class DatabaseUnavailable(Exception):
+    """Raised when the database cannot be reached (or the breaker is open)."""
+
+
+class ConnectFailed(Exception):
+    """Raised when no pooled connection could be obtained, so nothing was sent."""
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_seconds:
+                return False
+            self.state = self.HALF_OPEN
+        return True
+
+    def record_success(self) -> bool:
+        """Reset the breaker; returns True if it was not already closed."""
+        recovered = self.state != self.CLOSED
+        self.state = self.CLOSED
+        self.failures = 0
+        return recovered
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+            if self.state != self.OPEN:
+                print(f"Database circuit opened after {self.failures} failures")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+breaker = CircuitBreaker()
+# Keys include dates and ranges, so keep only the most recently used results
+_last_good: 'OrderedDict[Any, Any]' = OrderedDict()
+_write_handlers: Dict[str, Callable] = {}
+_replay_lock = asyncio.Lock()
+_replay_task: Optional[asyncio.Task] = None
+_has_pending_writes = os.path.exists(PENDING_WRITES_FILE) and os.path.getsize(PENDING_WRITES_FILE) > 0
+
+
+def is_degraded() -> bool:
+    return breaker.state != CircuitBreaker.CLOSED
+
+
+async def _run(fn, args, kwargs, retry_on):
+    if not breaker.allow():
+        raise DatabaseUnavailable("database unavailable (circuit open)")
+
+    last_error = None
+    for attempt in range(RETRY_ATTEMPTS):
+        try:
+            result = await fn(*args, **kwargs)
+        except retry_on as e:
+            last_error = e
+            if attempt + 1 < RETRY_ATTEMPTS:
+                delay = RETRY_BASE_DELAY * (2 ** attempt)
+                await asyncio.sleep(delay + random.uniform(0, delay))
+            continue
+        except TRANSIENT_ERRORS:
+            # The statement may already have been applied; don't run it again
+            breaker.record_failure()
+            raise
+        if breaker.record_success():
+            print("Database connection recovered")
+        _schedule_replay()
+        return result
+
+    breaker.record_failure()
+    raise DatabaseUnavailable(f"database unavailable: {last_error}") from last_error
+
+
+async def call(fn, *args, **kwargs):
+    """Run a read with retries for transient errors, guarded by the circuit breaker."""
+    return await _run(fn, args, kwargs, TRANSIENT_ERRORS + (ConnectFailed,))
+
+
+async def call_write(fn, *args, **kwargs):
+    """Run a write, retrying only failures that happened before anything was sent."""
+    return await _run(fn, args, kwargs, (ConnectFailed,))
+
+
+def _schedule_replay():
+    global _replay_task
+    if _has_pending_writes and not _replay_lock.locked() and (_replay_task is None or _replay_task.done()):
+        _replay_task = asyncio.get_running_loop().create_task(replay_pending_writes())
+
+
+def resilient(fn):
+    """Circuit-break a write and retry failed connects, but otherwise let failures propagate."""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await call_write(fn, *args, **kwargs)
+    return wrapper
+
+
+def resilient_read(fn):
+    """Like resilient, but serve the last-known-good result while the DB is down."""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        key = (fn.__name__, args, tuple(sorted(kwargs.items())))
+        try:
+            result = await call(fn, *args, **kwargs)
+        except DatabaseUnavailable:
+            if key in _last_good:
+                _last_good.move_to_end(key)
+                return _last_good[key]
+            raise
+        _last_good[key] = result
+        _last_good.move_to_end(key)
+        while len(_last_good) > LAST_GOOD_MAX_ENTRIES:
+            _last_good.popitem(last=False)
+        return result
+    return wrapper
+
+
+def buffered_write(stamp: Optional[str] = None):
+    """Like resilient, but queue the write locally while the DB is down.
+
+    ``stamp`` names a timestamp parameter that is filled with the time of the
+    call when the caller leaves it unset, so a write replayed later still
+    records when it happened. A queued write returns its arguments with
+    ``queued: True`` instead of the inserted row.
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+        _write_handlers[fn.__name__] = fn
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            if stamp and bound.arguments.get(stamp) is None:
+                bound.arguments[stamp] = datetime.now(timezone.utc)
+            try:
+                return await call_write(fn, *bound.args, **bound.kwargs)
+            except DatabaseUnavailable:
+                _enqueue_write(fn.__name__, dict(bound.arguments))
+                return {'queued': True, **bound.arguments}
+        return wrapper
+    return decorator
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, date):
+        return {'__date__': value.isoformat()}
+    raise TypeError(f"Cannot queue value of type {type(value).__name__}")
+
+
+def _decode(obj):
+    if '__datetime__' in obj:
+        return datetime.fromisoformat(obj['__datetime__'])
+    if '__date__' in obj:
+        return date.fromisoformat(obj['__date__'])
+    return obj
+
+
+def _enqueue_write(op: str, arguments: Dict):
+    global _has_pending_writes
+    entry = {'op': op, 'kwargs': arguments, 'queued_at': datetime.now().isoformat()}
+    with open(PENDING_WRITES_FILE, 'a') as f:
+        f.write(json.dumps(entry, default=_encode) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    _has_pending_writes = True
+    print(f"Database unavailable, queued {op} for replay")
+
+
+def _read_pending_lines():
+    if not os.path.exists(PENDING_WRITES_FILE):
+        return []
+    with open(PENDING_WRITES_FILE, 'r') as f:
+        return [line for line in f if line.strip()]
+
+
+async def replay_pending_writes() -> int:
+    """Replay queued writes in order; stops at the first one the DB still refuses."""
+    global _has_pending_writes
+    async with _replay_lock:
+        lines = _read_pending_lines()
+        done = 0
+        for line in lines:
+            entry = json.loads(line, object_hook=_decode)
+            fn = _write_handlers.get(entry['op'])
+            if fn is None:
+                print(f"Dropping queued write for unknown operation {entry['op']}")
+            else:
+                try:
+                    await call_write(fn, **entry['kwargs'])
+                except DatabaseUnavailable:
+                    break
+                except TRANSIENT_ERRORS as e:
+                    print(f"Dropping queued {entry['op']} whose replay was interrupted and may have applied: {e}")
+                except Exception as e:
+                    print(f"Dropping queued {entry['op']} that failed on replay: {e}")
+            done += 1
+
+        # Writes queued while we were replaying are appended after our snapshot
+        remaining = _read_pending_lines()[done:]
+        tmp_path = PENDING_WRITES_FILE + ".tmp"
+        with open(tmp_path, 'w') as f:
+            f.writelines(remaining)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, PENDING_WRITES_FILE)
+        _has_pending_writes = bool(remaining)
+
+        if done:
+            print(f"Replayed {done} queued database writes, {len(remaining)} still pending")
+        return done
@@ -0,0 +1,190 @@
+"""
+Rate-limited outbound Telegram sender.
+
+Handlers queue sends and edits here instead of awaiting the Bot API inline.
+Delivery respects a global and a per-chat token bucket, honours retry_after on
+429s, and collapses pending edits of the same message to the latest content.
+The bot is duck-typed (send_message / edit_message_text), so a local fake can
+stand in for Telegram.
+"""
+
+import time
+import asyncio
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Any, Iterable, Deque
+
+# Telegram allows roughly 30 messages/s overall and about 1/s to a single chat
+GLOBAL_RATE = 30.0
+CHAT_RATE = 1.0
+CHAT_BURST = 3
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        while True:
+            self._refill(time.monotonic())
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+@dataclass
+class _Job:
+    kind: str
+    chat_id: int
+    message_id: Optional[int]
+    text: str
+    kwargs: Dict[str, Any]
+    futures: List[asyncio.Future] = field(default_factory=list)
+
+
+def _retry_after_seconds(error) -> Optional[float]:
+    value = getattr(error, 'retry_after', None)
+    if value is None:
+        return None
+    return value.total_seconds() if hasattr(value, 'total_seconds') else float(value)
+
+
+def _log_failure(future: asyncio.Future):
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Error delivering Telegram message: {future.exception()}")
+
+
+class OutboundSender:
+    """Per-chat FIFO delivery with token-bucket limits and edit coalescing.
+
+    send() and edit() return futures; callers may await them for the result
+    but do not have to.
+    """
+
+    def __init__(
+        self,
+        bot,
+        global_rate: float = GLOBAL_RATE,
+        chat_rate: float = CHAT_RATE,
+        chat_burst: int = CHAT_BURST,
+        max_attempts: int = 5,
+        transient_errors: tuple = (OSError, asyncio.TimeoutError),
+        final_errors: tuple = ()
+    ):
+        self.bot = bot
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_attempts = max_attempts
+        self.transient_errors = transient_errors
+        # Deterministic rejections (bad markup, ...) that must not be retried,
+        # even when they subclass one of the transient errors
+        self.final_errors = final_errors
+        self.coalesced = 0
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._queues: Dict[int, Deque[_Job]] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self._pending_edits: Dict[tuple, _Job] = {}
+
+    def send(self, chat_id: int, text: str, **kwargs) -> asyncio.Future:
+        return self._enqueue(_Job('send', chat_id, None, text, kwargs))
+
+    def edit(self, chat_id: int, message_id: int, text: str, **kwargs) -> asyncio.Future:
+        key = (chat_id, message_id)
+        job = self._pending_edits.get(key)
+        if job is not None:
+            job.text = text
+            job.kwargs = kwargs
+            self.coalesced += 1
+            return self._add_future(job)
+        job = _Job('edit', chat_id, message_id, text, kwargs)
+        self._pending_edits[key] = job
+        return self._enqueue(job)
+
+    async def broadcast(self, chat_ids: Iterable[int], text: str, **kwargs) -> Dict[int, Any]:
+        """Send text to every chat; returns each chat's message or exception."""
+        chat_ids = list(dict.fromkeys(chat_ids))
+        results = await asyncio.gather(
+            *(self.send(chat_id, text, **kwargs) for chat_id in chat_ids),
+            return_exceptions=True
+        )
+        return dict(zip(chat_ids, results))
+
+    async def close(self):
+        """Wait for everything already queued to be delivered."""
+        while self._workers:
+            await asyncio.gather(*list(self._workers.values()), return_exceptions=True)
+
+    def _add_future(self, job: _Job) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_log_failure)
+        job.futures.append(future)
+        return future
+
+    def _enqueue(self, job: _Job) -> asyncio.Future:
+        future = self._add_future(job)
+        self._queues.setdefault(job.chat_id, deque()).append(job)
+        if job.chat_id not in self._workers:
+            self._workers[job.chat_id] = asyncio.get_running_loop().create_task(self._drain_chat(job.chat_id))
+        return future
+
+    async def _drain_chat(self, chat_id: int):
+        queue = self._queues[chat_id]
+        bucket = self._chat_buckets.setdefault(chat_id, TokenBucket(self.chat_rate, self.chat_burst))
+        try:
+            while queue:
+                # Wait for capacity before taking the job, so edits arriving
+                # meanwhile still coalesce into it
+                await bucket.acquire()
+                await self.global_bucket.acquire()
+                job = queue.popleft()
+                if job.kind == 'edit':
+                    self._pending_edits.pop((chat_id, job.message_id), None)
+                await self._deliver(job)
+        finally:
+            del self._workers[chat_id]
+            if not queue:
+                del self._queues[chat_id]
+
+    async def _call(self, job: _Job):
+        if job.kind == 'send':
+            return await self.bot.send_message(chat_id=job.chat_id, text=job.text, **job.kwargs)
+        return await self.bot.edit_message_text(
+            text=job.text, chat_id=job.chat_id, message_id=job.message_id, **job.kwargs
+        )
+
+    async def _deliver(self, job: _Job):
+        delay = 0.5
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                result = await self._call(job)
+                break
+            except Exception as e:
+                if job.kind == 'edit' and 'not modified' in str(e).lower():
+                    # Re-sending identical content; the message already shows it
+                    result = None
+                    break
+                retry = attempt < self.max_attempts and not isinstance(e, self.final_errors)
+                retry_after = _retry_after_seconds(e)
+                if retry and retry_after is not None:
+                    await asyncio.sleep(retry_after)
+                    continue
+                if retry and isinstance(e, self.transient_errors):
+                    await asyncio.sleep(delay)
+                    delay *= 2
+                    continue
+                for future in job.futures:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+        for future in job.futures:
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,185 @@
+"""
+Query tracing for the db_client pool.
+
+Every statement run through the pool is recorded against the current logical
+operation (one Telegram update). Operations that exceed their query budget or
+run the same statement more than once (the usual N+1 shape) are flagged.
+"""
+
+import os
+import time
+import functools
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Tuple
+
+import asyncpg
+
+DEFAULT_QUERY_BUDGET = int(os.environ.get('DB_QUERY_BUDGET', '4'))
+TRACE_ALL = os.environ.get('DB_TRACE', '').lower() in ('1', 'true', 'yes')
+
+
+@dataclass
+class QueryRecord:
+    statement: str
+    duration_ms: float
+    rows: int
+
+
+@dataclass
+class Operation:
+    name: str
+    budget: int = DEFAULT_QUERY_BUDGET
+    queries: List[QueryRecord] = field(default_factory=list)
+    started_at: float = field(default_factory=time.perf_counter)
+
+    @property
+    def count(self) -> int:
+        return len(self.queries)
+
+    @property
+    def total_ms(self) -> float:
+        return sum(q.duration_ms for q in self.queries)
+
+    def repeated_statements(self) -> Dict[str, int]:
+        seen: Dict[str, int] = {}
+        for q in self.queries:
+            seen[q.statement] = seen.get(q.statement, 0) + 1
+        return {stmt: n for stmt, n in seen.items() if n > 1}
+
+    def problems(self) -> List[str]:
+        issues = []
+        if self.count > self.budget:
+            issues.append(f"{self.count} queries (budget {self.budget})")
+        for stmt, n in self.repeated_statements().items():
+            issues.append(f"statement repeated {n}x: {_shorten(stmt)}")
+        return issues
+
+    def summary(self) -> str:
+        lines = [f"{self.name}: {self.count} queries, {self.total_ms:.1f}ms"]
+        for q in self.queries:
+            lines.append(f"  {q.duration_ms:7.1f}ms {q.rows:5d} rows  {_shorten(q.statement)}")
+        return "\n".join(lines)
+
+
+_active: contextvars.ContextVar[Tuple[Operation, ...]] = contextvars.ContextVar('db_operations', default=())
+
+
+def _shorten(statement: str, limit: int = 100) -> str:
+    text = " ".join(statement.split())
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+
+def _record(statement: str, started: float, rows: int):
+    active = _active.get()
+    if not active:
+        return
+    record = QueryRecord(" ".join(statement.split()), (time.perf_counter() - started) * 1000, rows)
+    for op in active:
+        op.queries.append(record)
+
+
+def _status_rows(status) -> int:
+    """Row count from a command tag like 'UPDATE 3' or 'INSERT 0 1'."""
+    if isinstance(status, str):
+        tail = status.rsplit(' ', 1)[-1]
+        if tail.isdigit():
+            return int(tail)
+    return 0
+
+
+def current_operation() -> Optional[Operation]:
+    active = _active.get()
+    return active[-1] if active else None
+
+
+@contextmanager
+def trace_operation(name: str, budget: Optional[int] = None):
+    """Collect every query run inside the block and report budget/N+1 problems on exit."""
+    op = Operation(name, DEFAULT_QUERY_BUDGET if budget is None else budget)
+    token = _active.set(_active.get() + (op,))
+    try:
+        yield op
+    finally:
+        _active.reset(token)
+        issues = op.problems()
+        if issues:
+            print(f"[query-trace] {op.name} over budget: " + "; ".join(issues))
+            print(op.summary())
+        elif TRACE_ALL and op.count:
+            print(op.summary())
+
+
+@contextmanager
+def assert_max_queries(n: int):
+    """Test helper: fail if the block runs more than n statements."""
+    op = Operation('assert_max_queries', n)
+    token = _active.set(_active.get() + (op,))
+    try:
+        yield op
+    finally:
+        _active.reset(token)
+    if op.count > n:
+        raise AssertionError(f"Expected at most {n} queries, got {op.count}\n{op.summary()}")
+
+
+def traced(handler, budget: Optional[int] = None):
+    """Wrap a Telegram handler so each update is traced as one operation."""
+    @functools.wraps(handler)
+    async def wrapper(update, context):
+        name = handler.__name__
+        query = getattr(update, 'callback_query', None)
+        if query is not None and query.data:
+            name = f"{name}:{query.data}"
+        with trace_operation(name, budget):
+            return await handler(update, context)
+    return wrapper
+
+
+class TracedConnection(asyncpg.Connection):
+    """asyncpg connection that reports each statement to the active operation."""
+
+    async def execute(self, query, *args, **kwargs):
+        started = time.perf_counter()
+        status = None
+        try:
+            status = await super().execute(query, *args, **kwargs)
+            return status
+        finally:
+            _record(query, started, _status_rows(status))
+
+    async def executemany(self, command, args, **kwargs):
+        started = time.perf_counter()
+        args = list(args)
+        try:
+            return await super().executemany(command, args, **kwargs)
+        finally:
+            _record(command, started, len(args))
+
+    async def fetch(self, query, *args, **kwargs):
+        started = time.perf_counter()
+        rows = []
+        try:
+            rows = await super().fetch(query, *args, **kwargs)
+            return rows
+        finally:
+            _record(query, started, len(rows))
+
+    async def fetchrow(self, query, *args, **kwargs):
+        started = time.perf_counter()
+        row = None
+        try:
+            row = await super().fetchrow(query, *args, **kwargs)
+            return row
+        finally:
+            _record(query, started, 1 if row is not None else 0)
+
+    async def fetchval(self, query, *args, **kwargs):
+        started = time.perf_counter()
+        value = None
+        try:
+            value = await super().fetchval(query, *args, **kwargs)
+            return value
+        finally:
+            _record(query, started, 1 if value is not None else 0)
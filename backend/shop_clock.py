@@ -0,0 +1,63 @@
+"""
+Shop-local calendar boundaries.
+
+The bot runs in containers that are usually on UTC while shops are not, so
+"today", "this week" and "this month" are resolved in the shop's timezone and
+handed to queries as typed dates / timezone-aware range bounds.
+"""
+
+import os
+from dataclasses import dataclass
+from datetime import datetime, date, time, timedelta
+from typing import Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+DEFAULT_TIMEZONE = os.environ.get('SHOP_TIMEZONE', 'America/Chicago')
+
+
+@dataclass(frozen=True)
+class ShopDay:
+    shop_id: Optional[int]
+    timezone: str
+    date: date
+    day_start: datetime
+    day_end: datetime
+    week_start: datetime
+    month_start: datetime
+
+
+def resolve_zone(name: Optional[str]) -> ZoneInfo:
+    try:
+        return ZoneInfo(name or DEFAULT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        print(f"Unknown shop timezone {name!r}, using {DEFAULT_TIMEZONE}")
+        return ZoneInfo(DEFAULT_TIMEZONE)
+
+
+def _local_midnight(day: date, zone: ZoneInfo) -> datetime:
+    return datetime.combine(day, time.min, tzinfo=zone)
+
+
+def range_bounds(start: date, end: date, timezone: Optional[str]) -> Tuple[datetime, datetime]:
+    """[start 00:00, day after end 00:00) in shop-local time, for inclusive date ranges."""
+    zone = resolve_zone(timezone)
+    return _local_midnight(start, zone), _local_midnight(end + timedelta(days=1), zone)
+
+
+def shop_day(shop_id: Optional[int], timezone: Optional[str], now: Optional[datetime] = None) -> ShopDay:
+    """Day/week/month boundaries for the shop-local date containing now.
+
+    Weeks start on Monday, matching Postgres DATE_TRUNC('week', ...).
+    """
+    zone = resolve_zone(timezone)
+    local_now = (now or datetime.now(zone)).astimezone(zone)
+    today = local_now.date()
+    return ShopDay(
+        shop_id=shop_id,
+        timezone=zone.key,
+        date=today,
+        day_start=_local_midnight(today, zone),
+        day_end=_local_midnight(today + timedelta(days=1), zone),
+        week_start=_local_midnight(today - timedelta(days=today.weekday()), zone),
+        month_start=_local_midnight(today.replace(day=1), zone)
+    )
@@ -4,6 +4,11 @@ Telegram Bot for SmartMirror - Barber Mirror Assistant
 Uses PostgreSQL database for persistence.
 """
 
+import time
+
+_phase_started = time.perf_counter()
+STARTUP_PHASES = []
+
 import os
 import sys
 import json
@@ -21,25 +26,36 @@ from telegram.ext import (
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 import db_client as db
+import walk_in_queue
+import analytics
+import analytics_api
+from query_trace import traced
+from change_feed import ChangeFeedDispatcher
+from outbound import OutboundSender
 
 TELEGRAM_LOG_FILE = os.path.join(os.path.dirname(__file__), "telegram_log.json")
 
 HIDDEN_COMMANDS = {'/start', '/help', '/today', '/earnings', '/menu', '/cancel'}
 
-SLOT_TO_TIME = {
-    "slot_0900": "9:00 AM",
-    "slot_1000": "10:00 AM",
-    "slot_1100": "11:00 AM",
-    "slot_1200": "12:00 PM",
-    "slot_1300": "1:00 PM",
-    "slot_1400": "2:00 PM",
-    "slot_1500": "3:00 PM",
-    "slot_1600": "4:00 PM",
-    "slot_1700": "5:00 PM"
-}
+def slot_label(start):
+    hour, minute = map(int, start.split(':'))
+    return f"{hour % 12 or 12}:{minute:02d} {'AM' if hour < 12 else 'PM'}"
+
+SLOT_TO_TIME = {slot: slot_label(start) for slot, start in db.SLOT_START_TIMES.items()}
 
 TIME_TO_SLOT = {v: k for k, v in SLOT_TO_TIME.items()}
 
+QUEUED_NOTE = "\n\n⚠️ Database offline - this will sync automatically."
+
+outbound = None
+
+def edit_message(query, text, **kwargs):
+    """Queue an edit of the callback's message; rapid taps collapse to the latest content."""
+    return outbound.edit(query.message.chat_id, query.message.message_id, text, **kwargs)
+
+def reply(update, text, **kwargs):
+    return outbound.send(update.effective_chat.id, text, **kwargs)
+
 def is_hidden_message(text):
     if not text:
         return False
@@ -80,6 +96,7 @@ async def log_message_to_db(sender, text, chat_id):
 def get_main_menu():
     keyboard = [
         [InlineKeyboardButton("📅 Today's Appointments", callback_data="appointments")],
+        [InlineKeyboardButton("🚶 Walk-in Queue", callback_data="walk_in_queue")],
         [InlineKeyboardButton("📊 Financial Tracking", callback_data="financial")],
         [InlineKeyboardButton("👥 Customer History", callback_data="customers")],
         [InlineKeyboardButton("📺 Mirror Controls", callback_data="mirror_controls")],
@@ -92,6 +109,7 @@ def get_financial_menu():
         [InlineKeyboardButton("💰 Record Sale", callback_data="record_sale")],
         [InlineKeyboardButton("📈 Today's Earnings", callback_data="today_earnings")],
         [InlineKeyboardButton("📊 Weekly Progress", callback_data="weekly_progress")],
+        [InlineKeyboardButton("📈 Trends", callback_data="analytics_30")],
         [InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu")]
     ]
     return InlineKeyboardMarkup(keyboard)
@@ -131,11 +149,78 @@ async def get_service_menu():
     except Exception as e:
         print(f"Error loading services: {e}")
         keyboard = [
-            [InlineKeyboardButton("💇 Haircut - $35", callback_data="svc_1")],
+            [InlineKeyboardButton("🔄 Retry", callback_data="book_appointment")],
             [InlineKeyboardButton("🔙 Back", callback_data="appointments")]
         ]
         return InlineKeyboardMarkup(keyboard)
 
+async def load_walk_in_queue(force=False):
+    day = await db.get_shop_day()
+    shop_id = await db.resolve_shop_id()
+    if shop_id is None:
+        raise ValueError("no shop is configured")
+    view = await walk_in_queue.get_view(shop_id, day, force)
+    return day, shop_id, view
+
+def format_walk_in_queue(view, header=""):
+    """Render the queue screen from the in-memory view (no DB access)."""
+    text = header + "🚶 *Walk-in Queue*\n\n"
+    keyboard = []
+    
+    for entry in view.by_status('in_service'):
+        text += f"✂️ In chair: {entry['customer_name']}\n"
+        keyboard.append([InlineKeyboardButton(f"✅ Done: {entry['customer_name']}", callback_data=f"queue_done_{entry['id']}")])
+    for entry in view.by_status('called'):
+        text += f"📣 Called: {entry['customer_name']}\n"
+        keyboard.append([InlineKeyboardButton(f"▶️ Start: {entry['customer_name']}", callback_data=f"queue_start_{entry['id']}")])
+    
+    waiting = view.waiting()
+    if waiting:
+        text += "\n*Waiting:*\n"
+        for position, entry in enumerate(waiting, start=1):
+            service = entry.get('service_name') or 'Walk-in'
+            text += f"{position}. {entry['customer_name']} - {service} (~{view.eta_minutes(entry['id'])} min)\n"
+    else:
+        text += "\nNo one waiting."
+    
+    keyboard.append([
+        InlineKeyboardButton("➕ Add Walk-in", callback_data="queue_add"),
+        InlineKeyboardButton("📣 Call Next", callback_data="queue_call")
+    ])
+    keyboard.append([InlineKeyboardButton("🔄 Refresh", callback_data="walk_in_queue")])
+    keyboard.append([InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu")])
+    return text, InlineKeyboardMarkup(keyboard)
+
+ANALYTICS_RANGES = [7, 30, 90, 365]
+
+def format_analytics(stats, days):
+    revenue = stats['revenue_cents'] / 100
+    text = f"📈 *Trends - last {days} days*\n\n"
+    text += f"Revenue: *${revenue:.2f}* ({stats['sales']} sales)\n"
+    text += f"Daily average: ${revenue / days:.2f}\n"
+    
+    best_day, best_cents = max(stats['daily_revenue'], key=lambda d: d[1])
+    if best_cents:
+        text += f"Best day: {best_day} (${best_cents / 100:.2f})\n"
+    busiest_hour = max(range(24), key=lambda h: stats['hourly_revenue'][h])
+    if stats['hourly_revenue'][busiest_hour]:
+        text += f"Busiest hour: {busiest_hour:02d}:00\n"
+    
+    if stats['appointments']:
+        text += f"\nAppointments: {stats['appointments']}\n"
+        text += f"Cancelled: {stats['cancel_rate'] * 100:.1f}% | No-show: {stats['no_show_rate'] * 100:.1f}%\n"
+    
+    if stats['service_mix']:
+        text += "\n*Top services:*\n"
+        for name, mix in list(stats['service_mix'].items())[:5]:
+            text += f"• {name}: {mix['count']} ({mix['share'] * 100:.0f}%)\n"
+    
+    if stats['barber_utilization']:
+        text += "\n*Slot utilization:*\n"
+        for name, util in stats['barber_utilization'].items():
+            text += f"• {name}: {util['utilization'] * 100:.0f}% over {util['days']} days\n"
+    return text
+
 def get_time_slots_menu():
     slots = list(SLOT_TO_TIME.items())
     keyboard = []
@@ -155,7 +240,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "• Send any text to display on mirror\n"
         "• Send a number (e.g., `45.50`) to record a sale\n"
     )
-    await update.message.reply_text(
+    reply(
+        update,
         welcome_text,
         reply_markup=get_main_menu(),
         parse_mode="Markdown"
@@ -167,14 +253,16 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     data = query.data
     
     if data == "main_menu":
-        await query.edit_message_text(
+        edit_message(
+            query,
             "🪞 *Barber Admin Dashboard*\n\nSelect an option:",
             reply_markup=get_main_menu(),
             parse_mode="Markdown"
         )
     
     elif data == "appointments":
-        await query.edit_message_text(
+        edit_message(
+            query,
             "📅 *Appointments*\n\nManage today's schedule:",
             reply_markup=get_appointments_menu(),
             parse_mode="Markdown"
@@ -182,8 +270,8 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     elif data == "view_today":
         try:
-            today = datetime.now().strftime("%Y-%m-%d")
-            appointments = await db.get_appointments_by_date(today)
+            day = await db.get_shop_day()
+            appointments = await db.get_appointments_by_date(day.date)
             
             if appointments:
                 text = "📅 *Today's Appointments:*\n\n"
@@ -200,19 +288,65 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             text = f"📅 Error loading appointments: {e}"
         
         keyboard = [[InlineKeyboardButton("🔙 Back", callback_data="appointments")]]
-        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="Markdown")
+        edit_message(query, text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="Markdown")
+    
+    elif data == "walk_in_queue" or data == "queue_call" or data.startswith(("queue_start_", "queue_done_")):
+        try:
+            # Opening or refreshing the screen always re-reads the queue; admin
+            # API changes don't reach the cached view any other way
+            day, shop_id, view = await load_walk_in_queue(force=(data == "walk_in_queue"))
+            header = ""
+            
+            if data == "queue_call":
+                barber = await db.get_barber_by_chat_id(update.effective_chat.id)
+                entry = await db.call_next_walk_in(shop_id, day, barber_id=barber['id'] if barber else None)
+                if entry:
+                    view.apply(entry)
+                    header = f"📣 Next up: *{entry['customer_name']}*\n\n"
+                else:
+                    header = "Nobody is waiting for you right now.\n\n"
+            elif data.startswith("queue_start_"):
+                barber = await db.get_barber_by_chat_id(update.effective_chat.id)
+                entry = await db.start_walk_in_service(int(data.replace("queue_start_", "")), barber['id'] if barber else None)
+                if entry:
+                    view.apply(entry)
+                    header = f"▶️ Started: *{entry['customer_name']}*\n\n"
+            elif data.startswith("queue_done_"):
+                entry = await db.complete_walk_in_service(int(data.replace("queue_done_", "")))
+                if entry:
+                    view.apply(entry)
+                    header = f"✅ Finished: *{entry['customer_name']}*\n\n"
+            
+            text, markup = format_walk_in_queue(view, header)
+        except Exception as e:
+            text = f"🚶 Error loading queue: {e}"
+            markup = InlineKeyboardMarkup([[InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu")]])
+        
+        edit_message(query, text, reply_markup=markup, parse_mode="Markdown")
+    
+    elif data == "queue_add":
+        context.user_data["awaiting"] = "walk_in_name"
+        keyboard = [[InlineKeyboardButton("❌ Cancel", callback_data="walk_in_queue")]]
+        edit_message(
+            query,
+            "🚶 *Add Walk-in*\n\nEnter the customer's name:",
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode="Markdown"
+        )
     
     elif data == "running_late":
         context.user_data["awaiting"] = "running_late"
         keyboard = [[InlineKeyboardButton("❌ Cancel", callback_data="appointments")]]
-        await query.edit_message_text(
+        edit_message(
+            query,
             "⏰ *Running Late Alert*\n\nEnter client name and appointment time:\n\nExample: `John 6:00 PM`",
             reply_markup=InlineKeyboardMarkup(keyboard),
             parse_mode="Markdown"
         )
     
     elif data == "financial":
-        await query.edit_message_text(
+        edit_message(
+            query,
             "📊 *Financial Tracking*\n\nTrack your earnings:",
             reply_markup=get_financial_menu(),
             parse_mode="Markdown"
@@ -221,7 +355,8 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif data == "record_sale":
         context.user_data["awaiting"] = "sale_amount"
         keyboard = [[InlineKeyboardButton("❌ Cancel", callback_data="financial")]]
-        await query.edit_message_text(
+        edit_message(
+            query,
             "💰 *Record Sale*\n\nEnter sale amount (e.g., `45.50`):",
             reply_markup=InlineKeyboardMarkup(keyboard),
             parse_mode="Markdown"
@@ -229,9 +364,8 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     elif data == "today_earnings":
         try:
-            transactions = await db.get_recent_transactions(50)
-            today = datetime.now().strftime("%Y-%m-%d")
-            today_transactions = [t for t in transactions if str(t.get('occurred_at', ''))[:10] == today]
+            day = await db.get_shop_day()
+            today_transactions = await db.get_transactions_between(day.day_start, day.day_end)
             today_total = sum(t.get("amount_cents", 0) for t in today_transactions) / 100
             
             text = f"💰 *Today's Earnings*\n\nTotal: *${today_total:.2f}*\n\n"
@@ -245,11 +379,12 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             text = f"💰 Error loading earnings: {e}"
         
         keyboard = [[InlineKeyboardButton("🔙 Back", callback_data="financial")]]
-        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="Markdown")
+        edit_message(query, text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="Markdown")
     
     elif data == "weekly_progress":
         try:
-            budget = await db.get_budget_summary()
+            day = await db.get_shop_day()
+            budget = await db.get_budget_summary(day.week_start, day.month_start)
             weekly_total = budget['current_week_earned'] / 100
             weekly_goal = budget['weekly_goal'] / 100
             
@@ -266,12 +401,26 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             text = f"📊 Error loading progress: {e}"
         
         keyboard = [[InlineKeyboardButton("🔙 Back", callback_data="financial")]]
-        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="Markdown")
+        edit_message(query, text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="Markdown")
+    
+    elif data.startswith("analytics_"):
+        try:
+            days = int(data.replace("analytics_", ""))
+            today = (await db.get_shop_day()).date
+            stats = await analytics.get_analytics(today - timedelta(days=days - 1), today)
+            text = format_analytics(stats, days)
+        except Exception as e:
+            text = f"📈 Error loading trends: {e}"
+        
+        keyboard = [
+            [InlineKeyboardButton(f"{n}d", callback_data=f"analytics_{n}") for n in ANALYTICS_RANGES],
+            [InlineKeyboardButton("🔙 Back", callback_data="financial")]
+        ]
+        edit_message(query, text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="Markdown")
     
     elif data == "customers":
         try:
-            async with (await db.init_pool()).acquire() as conn:
-                users = await conn.fetch("SELECT * FROM users ORDER BY recognition_count DESC LIMIT 10")
+            users = await db.get_top_customers(10)
             
             if users:
                 text = "👥 *Customer History*\n\n"
@@ -284,10 +433,11 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             text = f"👥 Error loading customers: {e}"
         
         keyboard = [[InlineKeyboardButton("🔙 Main Menu", callback_data="main_menu")]]
-        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="Markdown")
+        edit_message(query, text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="Markdown")
     
     elif data == "mirror_controls":
-        await query.edit_message_text(
+        edit_message(
+            query,
             "📺 *Mirror Controls*\n\nRemotely control the mirror:",
             reply_markup=get_mirror_controls_menu(),
             parse_mode="Markdown"
@@ -306,7 +456,8 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "clear": "Clear Display"
         }
         
-        await query.edit_message_text(
+        edit_message(
+            query,
             f"✅ Command sent: *{command_names.get(command, command)}*\n\nThe mirror will update shortly.",
             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Back", callback_data="mirror_controls")]]),
             parse_mode="Markdown"
@@ -315,7 +466,8 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif data == "send_message":
         context.user_data["awaiting"] = "mirror_message"
         keyboard = [[InlineKeyboardButton("❌ Cancel", callback_data="main_menu")]]
-        await query.edit_message_text(
+        edit_message(
+            query,
             "💬 *Send Message to Mirror*\n\nType your message below.\n\nExamples:\n• `Running 10 mins late!`\n• `Special: 20% off today!`",
             reply_markup=InlineKeyboardMarkup(keyboard),
             parse_mode="Markdown"
@@ -323,7 +475,8 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     elif data == "book_appointment":
         service_menu = await get_service_menu()
-        await query.edit_message_text(
+        edit_message(
+            query,
             "📅 *Book Appointment*\n\nSelect a service:",
             reply_markup=service_menu,
             parse_mode="Markdown"
@@ -339,20 +492,23 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 context.user_data["booking_service"] = service['name']
                 context.user_data["booking_price"] = service['price_cents'] / 100
                 
-                await query.edit_message_text(
+                edit_message(
+                    query,
                     f"📅 *Book: {service['name']}* (${service['price_cents']/100:.0f})\n\nSelect a time slot:",
                     reply_markup=get_time_slots_menu(),
                     parse_mode="Markdown"
                 )
             else:
-                await query.edit_message_text(
+                edit_message(
+                    query,
                     "❌ Service not found. Please try again.",
                     reply_markup=get_appointments_menu(),
                     parse_mode="Markdown"
                 )
         except Exception as e:
             print(f"Error selecting service: {e}")
-            await query.edit_message_text(
+            edit_message(
+                query,
                 "❌ Error loading service. Please try again.",
                 reply_markup=get_appointments_menu(),
                 parse_mode="Markdown"
@@ -366,7 +522,8 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         service = context.user_data.get("booking_service", "Service")
         keyboard = [[InlineKeyboardButton("❌ Cancel", callback_data="appointments")]]
-        await query.edit_message_text(
+        edit_message(
+            query,
             f"📅 *Almost Done!*\n\nService: {service}\nTime: {time_str}\n\nPlease enter your name:",
             reply_markup=InlineKeyboardMarkup(keyboard),
             parse_mode="Markdown"
@@ -374,8 +531,8 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     elif data == "cancel_appointment":
         try:
-            today = datetime.now().strftime("%Y-%m-%d")
-            appointments = await db.get_appointments_by_date(today)
+            day = await db.get_shop_day()
+            appointments = await db.get_appointments_by_date(day.date)
             
             if appointments:
                 keyboard = []
@@ -385,21 +542,24 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     keyboard.append([InlineKeyboardButton(f"❌ {apt_text}", callback_data=f"cancel_apt_{apt['id']}")])
                 keyboard.append([InlineKeyboardButton("🔙 Back", callback_data="appointments")])
                 
-                await query.edit_message_text(
+                edit_message(
+                    query,
                     "❌ *Cancel Appointment*\n\nSelect appointment to cancel:",
                     reply_markup=InlineKeyboardMarkup(keyboard),
                     parse_mode="Markdown"
                 )
             else:
                 keyboard = [[InlineKeyboardButton("🔙 Back", callback_data="appointments")]]
-                await query.edit_message_text(
+                edit_message(
+                    query,
                     "📅 No appointments to cancel today.",
                     reply_markup=InlineKeyboardMarkup(keyboard),
                     parse_mode="Markdown"
                 )
         except Exception as e:
             keyboard = [[InlineKeyboardButton("🔙 Back", callback_data="appointments")]]
-            await query.edit_message_text(
+            edit_message(
+                query,
                 f"❌ Error loading appointments: {e}",
                 reply_markup=InlineKeyboardMarkup(keyboard),
                 parse_mode="Markdown"
@@ -408,23 +568,25 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif data.startswith("cancel_apt_"):
         try:
             apt_id = int(data.replace("cancel_apt_", ""))
-            async with (await db.init_pool()).acquire() as conn:
-                apt = await conn.fetchrow("SELECT * FROM appointments WHERE id = $1", apt_id)
-                await conn.execute("UPDATE appointments SET status = 'cancelled' WHERE id = $1", apt_id)
+            apt = await db.cancel_appointment(apt_id)
             
-            if apt:
+            if apt and apt.get('queued'):
+                text = "✅ Appointment cancelled!" + QUEUED_NOTE
+            elif apt:
                 time_display = SLOT_TO_TIME.get(apt['time_slot'], apt['time_slot'])
                 text = f"✅ Appointment cancelled!\n\n{time_display} - {apt['client_name']}"
             else:
                 text = "✅ Appointment cancelled!"
             
-            await query.edit_message_text(
+            edit_message(
+                query,
                 text,
                 reply_markup=get_appointments_menu(),
                 parse_mode="Markdown"
             )
         except Exception as e:
-            await query.edit_message_text(
+            edit_message(
+                query,
                 f"❌ Error cancelling: {e}",
                 reply_markup=get_appointments_menu(),
                 parse_mode="Markdown"
@@ -443,33 +605,62 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             amount = float(text.replace("$", "").replace(",", ""))
             amount_cents = int(amount * 100)
             
-            await db.add_transaction(amount_cents, "Sale", "Walk-in")
+            result = await db.add_transaction(amount_cents, "Sale", "Walk-in")
             
             context.user_data["awaiting"] = None
-            await update.message.reply_text(
-                f"✅ Sale of *${amount:.2f}* recorded!",
+            reply(
+                update,
+                f"✅ Sale of *${amount:.2f}* recorded!" + (QUEUED_NOTE if result.get('queued') else ""),
                 reply_markup=get_financial_menu(),
                 parse_mode="Markdown"
             )
             return
         except ValueError:
-            await update.message.reply_text(
+            reply(
+                update,
                 "❌ Invalid amount. Please enter a number (e.g., `45.50`):",
                 parse_mode="Markdown"
             )
             return
         except Exception as e:
-            await update.message.reply_text(
+            reply(
+                update,
                 f"❌ Error recording sale: {e}",
                 parse_mode="Markdown"
             )
             return
     
+    elif awaiting == "walk_in_name":
+        context.user_data["awaiting"] = None
+        try:
+            day, shop_id, view = await load_walk_in_queue()
+            entry = await db.enqueue_walk_in(shop_id, text, day)
+            view.apply(entry)
+            header = (
+                f"✅ *{text}* added - position {view.position(entry['id'])}, "
+                f"about {view.eta_minutes(entry['id'])} min\n\n"
+            )
+            queue_text, markup = format_walk_in_queue(view, header)
+            reply(update, queue_text, reply_markup=markup, parse_mode="Markdown")
+        except Exception as e:
+            reply(update, f"❌ Error adding walk-in: {e}", reply_markup=get_main_menu(), parse_mode="Markdown")
+        return
+    
     elif awaiting == "running_late":
         await log_message_to_db(sender, f"[LATE] {text}", chat_id)
         context.user_data["awaiting"] = None
         
-        await update.message.reply_text(
+        try:
+            staff_chats = [c for c in await db.get_staff_chat_ids() if c != chat_id]
+            if staff_chats:
+                context.application.create_task(
+                    outbound.broadcast(staff_chats, f"⏰ *Running late:* {text}\n\n_from {sender}_", parse_mode="Markdown")
+                )
+        except Exception as e:
+            print(f"Error notifying staff: {e}")
+        
+        reply(
+            update,
             f"✅ Late notification sent!\n\nMessage: *{text}*\n\nThe mirror will display this alert.",
             reply_markup=get_main_menu(),
             parse_mode="Markdown"
@@ -480,7 +671,8 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await log_message_to_db(sender, text, chat_id)
         context.user_data["awaiting"] = None
         
-        await update.message.reply_text(
+        reply(
+            update,
             f"✅ Message sent to mirror!\n\n\"{text}\"",
             reply_markup=get_main_menu(),
             parse_mode="Markdown"
@@ -495,13 +687,30 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         time_str = context.user_data.get("booking_time", "TBD")
         price = context.user_data.get("booking_price", 0)
         
-        today = datetime.now().strftime("%Y-%m-%d")
-        
         try:
-            conflict = await db.check_appointment_conflict(today, time_slot)
-            if conflict:
+            day = await db.get_shop_day()
+            try:
+                booking = await db.create_appointment(
+                    client_name=customer_name,
+                    service_id=service_id,
+                    appt_date=day.date,
+                    time_slot=time_slot,
+                    booked_by=sender
+                )
+            except db.DatabaseUnavailable:
+                # Bookings can't be queued: the slot couldn't be checked for conflicts
+                reply(
+                    update,
+                    "⚠️ *Booking Unavailable*\n\nThe database is offline, so this slot can't be reserved right now.\nPlease try again in a few minutes.",
+                    reply_markup=get_main_menu(),
+                    parse_mode="Markdown"
+                )
+                context.user_data["awaiting"] = None
+                return
+            if booking is None:
                 keyboard = [[InlineKeyboardButton("🔙 Try Again", callback_data="book_appointment")]]
-                await update.message.reply_text(
+                reply(
+                    update,
                     f"⚠️ *Time Slot Taken*\n\nSorry, {time_str} is already booked.\nPlease select a different time.",
                     reply_markup=InlineKeyboardMarkup(keyboard),
                     parse_mode="Markdown"
@@ -509,14 +718,6 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 context.user_data["awaiting"] = None
                 return
             
-            await db.create_appointment(
-                client_name=customer_name,
-                service_id=service_id,
-                appt_date=today,
-                time_slot=time_slot,
-                booked_by=sender
-            )
-            
             context.user_data["awaiting"] = None
             context.user_data["booking_service"] = None
             context.user_data["booking_service_id"] = None
@@ -524,7 +725,8 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             context.user_data["booking_time"] = None
             context.user_data["booking_price"] = None
             
-            await update.message.reply_text(
+            reply(
+                update,
                 f"✅ *Appointment Booked!*\n\n"
                 f"👤 Name: {customer_name}\n"
                 f"✂️ Service: {service}\n"
@@ -536,7 +738,8 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
         except Exception as e:
-            await update.message.reply_text(
+            reply(
+                update,
                 f"❌ Error booking appointment: {e}",
                 reply_markup=get_main_menu(),
                 parse_mode="Markdown"
@@ -548,10 +751,12 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         amount = float(text.replace("$", "").replace(",", ""))
         amount_cents = int(amount * 100)
         
-        await db.add_transaction(amount_cents, "Sale", "Walk-in")
+        result = await db.add_transaction(amount_cents, "Sale", "Walk-in")
         
-        await update.message.reply_text(
-            f"💰 Sale of *${amount:.2f}* recorded!\n\nSend /start for full menu.",
+        reply(
+            update,
+            f"💰 Sale of *${amount:.2f}* recorded!\n\nSend /start for full menu."
+            + (QUEUED_NOTE if result.get('queued') else ""),
             parse_mode="Markdown"
         )
         return
@@ -562,7 +767,8 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     await log_message_to_db(sender, text, chat_id)
     
-    await update.message.reply_text(
+    reply(
+        update,
         f"📺 Message sent to mirror!\n\n\"{text}\"\n\nSend /start for menu options.",
         parse_mode="Markdown"
     )
@@ -584,12 +790,12 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "👥 Customer history\n"
         "📺 Remote mirror control"
     )
-    await update.message.reply_text(help_text, parse_mode="Markdown")
+    reply(update, help_text, parse_mode="Markdown")
 
 async def today_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        today = datetime.now().strftime("%Y-%m-%d")
-        appointments = await db.get_appointments_by_date(today)
+        day = await db.get_shop_day()
+        appointments = await db.get_appointments_by_date(day.date)
         
         if appointments:
             text = "📅 *Today's Appointments:*\n\n"
@@ -602,49 +808,102 @@ async def today_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         text = f"📅 Error loading appointments: {e}"
     
-    await update.message.reply_text(text, parse_mode="Markdown")
+    reply(update, text, parse_mode="Markdown")
 
 async def earnings_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        transactions = await db.get_recent_transactions(50)
-        today = datetime.now().strftime("%Y-%m-%d")
-        today_total = sum(
-            t.get("amount_cents", 0) for t in transactions 
-            if str(t.get('occurred_at', ''))[:10] == today
-        ) / 100
+        day = await db.get_shop_day()
+        transactions = await db.get_transactions_between(day.day_start, day.day_end)
+        today_total = sum(t.get("amount_cents", 0) for t in transactions) / 100
         
         text = f"💰 *Today's Earnings: ${today_total:.2f}*"
     except Exception as e:
         text = f"💰 Error loading earnings: {e}"
     
-    await update.message.reply_text(text, parse_mode="Markdown")
+    reply(update, text, parse_mode="Markdown")
 
-async def clear_telegram_connection(token):
-    """Clear any existing Telegram connections before starting."""
-    import aiohttp
-    
-    print("Clearing existing Telegram connections...")
+STARTUP_PROBE_TIMEOUT = float(os.environ.get("TELEGRAM_STARTUP_PROBE_TIMEOUT", "15"))
+
+def mark_phase(name):
+    """Record how long the startup phase that just finished took."""
+    global _phase_started
+    now = time.perf_counter()
+    STARTUP_PHASES.append((name, now - _phase_started))
+    _phase_started = now
+
+def print_startup_report():
+    total = sum(seconds for _, seconds in STARTUP_PHASES)
+    print(f"Startup took {total:.2f}s:")
+    for name, seconds in STARTUP_PHASES:
+        print(f"  {name:<22} {seconds * 1000:8.1f}ms")
+
+async def prepare_telegram_connection(bot):
+    """Clear a webhook only if one is set, then wait until polling is free.
+
+    A previous bot instance may still hold the getUpdates long-poll for a few
+    seconds after it was killed; Telegram answers 409 Conflict until it lets go.
+    Probe for that instead of sleeping a fixed amount.
+    """
+    from telegram.error import Conflict
+
+    info = await bot.get_webhook_info()
+    if info.url:
+        await bot.delete_webhook(drop_pending_updates=True)
+        print(f"Cleared webhook {info.url}")
+
+    delay = 0.25
+    deadline = time.perf_counter() + STARTUP_PROBE_TIMEOUT
+    while True:
+        try:
+            await bot.get_updates(offset=-1, timeout=0)
+            return
+        except Conflict:
+            if time.perf_counter() >= deadline:
+                print("Warning: another getUpdates session is still active, starting anyway")
+                return
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 2.0)
+
+async def warm_up_database():
+    """Open the pool and prime the queries every first screen needs."""
+    await db.init_pool()
+    await db.get_services(active_only=True)
+    await db.replay_pending_writes()
+
+async def post_init(application):
+    global outbound
+    from telegram.error import NetworkError, BadRequest
+    # BadRequest subclasses NetworkError but retrying it can never succeed
+    outbound = OutboundSender(application.bot, transient_errors=(NetworkError,), final_errors=(BadRequest,))
+    application.bot_data["change_feed"] = ChangeFeedDispatcher("telegram_bot")
+    mark_phase("initialize (getMe)")
+    results = await asyncio.gather(
+        prepare_telegram_connection(application.bot),
+        warm_up_database(),
+        return_exceptions=True
+    )
+    for label, result in zip(("Telegram probe", "Database warm-up"), results):
+        if isinstance(result, Exception):
+            print(f"Warning: {label} failed: {result}")
+    application.bot_data["change_feed"].start()
     try:
-        async with aiohttp.ClientSession() as session:
-            url = f"https://api.telegram.org/bot{token}/deleteWebhook?drop_pending_updates=true"
-            async with session.get(url) as resp:
-                result = await resp.json()
-                if result.get('ok'):
-                    print("Cleared pending updates and webhook")
-                else:
-                    print(f"Webhook clear result: {result}")
-                    
-            url2 = f"https://api.telegram.org/bot{token}/getUpdates?offset=-1&timeout=0"
-            async with session.get(url2) as resp:
-                result2 = await resp.json()
-                print(f"Flushed update queue: {result2.get('ok', False)}")
-                
-        print("Waiting for Telegram to release old connections...")
-        await asyncio.sleep(5)
-    except Exception as e:
-        print(f"Warning: Could not clear webhook: {e}")
+        await analytics_api.start()
+    except OSError as e:
+        print(f"Warning: analytics API not started: {e}")
+    mark_phase("probe + warm-up")
+    print_startup_report()
+
+async def post_shutdown(application):
+    await analytics_api.stop()
+    if outbound:
+        await outbound.close()
+    feed = application.bot_data.get("change_feed")
+    if feed:
+        await feed.stop()
+    await db.close_pool()
 
 def main():
+    mark_phase("imports")
     token = os.environ.get("TELEGRAM_BOT_TOKEN")
     
     if not token:
@@ -654,16 +913,15 @@ def main():
     print("Starting Barber Mirror Assistant Bot...")
     print(f"Bot token configured: {token[:10]}...")
     
-    asyncio.run(clear_telegram_connection(token))
-    
-    application = Application.builder().token(token).build()
+    application = Application.builder().token(token).post_init(post_init).post_shutdown(post_shutdown).build()
     
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("today", today_command))
-    application.add_handler(CommandHandler("earnings", earnings_command))
-    application.add_handler(CallbackQueryHandler(handle_callback))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    application.add_handler(CommandHandler("start", traced(start)))
+    application.add_handler(CommandHandler("help", traced(help_command)))
+    application.add_handler(CommandHandler("today", traced(today_command)))
+    application.add_handler(CommandHandler("earnings", traced(earnings_command)))
+    application.add_handler(CallbackQueryHandler(traced(handle_callback)))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, traced(handle_message)))
+    mark_phase("build application")
     
     print("Bot is running! Send /start to @BarberMirrorBot to begin.")
     
@@ -0,0 +1,115 @@
+"""OutboundSender against a local fake of the Bot API."""
+
+import asyncio
+
+from outbound import OutboundSender
+
+
+class FakeNetworkError(Exception):
+    pass
+
+
+class FakeBadRequest(FakeNetworkError):
+    """Like telegram.error.BadRequest, a subclass of the transient error."""
+
+
+class FakeRetryAfter(Exception):
+    def __init__(self, seconds):
+        super().__init__(f"Flood control exceeded. Retry in {seconds} seconds")
+        self.retry_after = seconds
+
+
+class FakeBot:
+    """Records calls; failures are queued per chat as exceptions to raise."""
+
+    def __init__(self):
+        self.calls = []
+        self.failures = {}
+        self.next_message_id = 100
+
+    def _maybe_fail(self, chat_id):
+        pending = self.failures.get(chat_id)
+        if pending:
+            raise pending.pop(0)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls.append(('send', chat_id, text))
+        self._maybe_fail(chat_id)
+        self.next_message_id += 1
+        return {'chat_id': chat_id, 'message_id': self.next_message_id, 'text': text}
+
+    async def edit_message_text(self, text, chat_id, message_id, **kwargs):
+        self.calls.append(('edit', chat_id, text))
+        self._maybe_fail(chat_id)
+        return {'chat_id': chat_id, 'message_id': message_id, 'text': text}
+
+
+def _sender(bot, **kwargs):
+    return OutboundSender(
+        bot, transient_errors=(FakeNetworkError,), final_errors=(FakeBadRequest,), **kwargs
+    )
+
+
+def test_pending_edits_coalesce_to_latest_text():
+    async def main():
+        bot = FakeBot()
+        sender = _sender(bot, chat_rate=20, chat_burst=1)
+        sender.send(1, "menu")
+        futures = [sender.edit(1, 7, f"queue v{n}") for n in range(1, 4)]
+        results = await asyncio.gather(*futures)
+        await sender.close()
+        return bot, sender, results
+
+    bot, sender, results = asyncio.run(main())
+    assert bot.calls == [('send', 1, "menu"), ('edit', 1, "queue v3")]
+    assert sender.coalesced == 2
+    assert all(r['text'] == "queue v3" for r in results)
+
+
+def test_retry_after_is_honoured():
+    async def main():
+        bot = FakeBot()
+        bot.failures[1] = [FakeRetryAfter(0.01)]
+        sender = _sender(bot)
+        result = await sender.send(1, "hello")
+        await sender.close()
+        return bot, result
+
+    bot, result = asyncio.run(main())
+    assert [c[0] for c in bot.calls] == ['send', 'send']
+    assert result['text'] == "hello"
+
+
+def test_bad_request_is_not_retried():
+    async def main():
+        bot = FakeBot()
+        bot.failures[1] = [FakeBadRequest("Message is not modified"), FakeBadRequest("Can't parse entities")]
+        sender = _sender(bot)
+        edited = await sender.edit(1, 7, "same")
+        try:
+            await sender.send(1, "*broken")
+        except FakeBadRequest as e:
+            failed = e
+        await sender.close()
+        return bot, edited, failed
+
+    bot, edited, failed = asyncio.run(main())
+    assert edited is None
+    assert "parse entities" in str(failed)
+    assert len(bot.calls) == 2
+
+
+def test_broadcast_reports_each_chat():
+    async def main():
+        bot = FakeBot()
+        bot.failures[3] = [FakeBadRequest("Chat not found")]
+        sender = _sender(bot)
+        results = await sender.broadcast([1, 2, 2, 3], "running late")
+        await sender.close()
+        return bot, results
+
+    bot, results = asyncio.run(main())
+    assert sorted(c[1] for c in bot.calls) == [1, 2, 3]
+    assert results[1]['text'] == "running late"
+    assert results[2]['text'] == "running late"
+    assert isinstance(results[3], FakeBadRequest)
@@ -0,0 +1,92 @@
+"""Query budgets for the bot's hot write paths, against a fake pool."""
+
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import date
+
+import pytest
+
+import db_client as db
+from query_trace import assert_max_queries, _record
+
+
+class FakeConnection:
+    """Stands in for TracedConnection: answers every statement and reports it."""
+
+    def __init__(self, row):
+        self.row = row
+
+    def _report(self, query, rows):
+        _record(query, time.perf_counter(), rows)
+
+    async def execute(self, query, *args):
+        self._report(query, 1)
+        return 'SELECT 1'
+
+    async def fetchrow(self, query, *args):
+        self._report(query, 1)
+        return self.row
+
+    async def fetch(self, query, *args):
+        self._report(query, 1)
+        return [self.row]
+
+    async def fetchval(self, query, *args):
+        self._report(query, 1)
+        return 1
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+
+class FakePool:
+    def __init__(self, row):
+        self.conn = FakeConnection(row)
+
+    async def acquire(self):
+        return self.conn
+
+    async def release(self, conn):
+        pass
+
+
+@pytest.fixture
+def fake_pool(monkeypatch):
+    row = {'id': 1, 'shop_id': 1, 'appointment_date': date(2026, 1, 5), 'status': 'scheduled'}
+    monkeypatch.setattr(db, 'pool', FakePool(row))
+    # Resolving the shop is memoized; measure the cold path
+    monkeypatch.setattr(db, '_resolved_shop_ids', {})
+    return row
+
+
+def _run(n, coro_fn):
+    async def main():
+        with assert_max_queries(n) as op:
+            await coro_fn()
+        return op
+    return asyncio.run(main())
+
+
+def test_booking_budget(fake_pool):
+    op = _run(3, lambda: db.create_appointment(
+        client_name='Sam', service_id=1, appt_date=date(2026, 1, 5),
+        time_slot='slot_0900', booked_by='test'
+    ))
+    assert not op.repeated_statements()
+
+
+def test_cancel_budget(fake_pool):
+    op = _run(1, lambda: db.cancel_appointment(1))
+    assert not op.repeated_statements()
+
+
+def test_message_log_budget(fake_pool):
+    op = _run(2, lambda: db.log_message(42, 'Sam', 'hello'))
+    assert not op.repeated_statements()
+
+
+def test_over_budget_is_reported(fake_pool):
+    with pytest.raises(AssertionError):
+        _run(1, lambda: db.log_message(42, 'Sam', 'hello'))
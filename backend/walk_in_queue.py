@@ -0,0 +1,120 @@
+"""
+In-memory view of today's walk-in line.
+
+Loaded through db_client and kept current from the bot's own queue writes and
+queue.* change events (the admin API emits them too), so "position / ETA"
+answers need no query. Anything written outside both paths is picked up by
+reloading once the view is older than QUEUE_VIEW_TTL seconds, and whenever
+the queue screen is opened or refreshed.
+"""
+
+import os
+import time
+from datetime import date
+from typing import Optional, List, Dict
+
+import db_client as db
+from change_feed import subscribe, QUEUE_JOINED, QUEUE_CALLED, QUEUE_STARTED, QUEUE_COMPLETED, QUEUE_NO_SHOW
+from shop_clock import ShopDay
+
+DEFAULT_DURATION_MINUTES = 30
+QUEUE_VIEW_TTL = float(os.environ.get('QUEUE_VIEW_TTL', '30'))
+
+# Events can arrive after the bot already applied a newer state directly
+STATUS_RANK = {'waiting': 0, 'called': 1, 'in_service': 2, 'completed': 3, 'no_show': 3}
+OPEN_STATUSES = ('waiting', 'called', 'in_service')
+
+
+class WalkInQueueView:
+    def __init__(self, shop_id: int):
+        self.shop_id = shop_id
+        self.day: Optional[date] = None
+        self.loaded_at = 0.0
+        self.entries: Dict[int, Dict] = {}
+        self.durations: Dict[int, int] = {}
+        self.barbers_on_shift = 1
+
+    async def ensure_loaded(self, day: ShopDay, force: bool = False):
+        fresh = time.monotonic() - self.loaded_at < QUEUE_VIEW_TTL
+        if self.day == day.date and fresh and not force:
+            return
+        snapshot = await db.get_walk_in_queue(self.shop_id, day)
+        if self.day != day.date or not self.durations:
+            services = await db.get_services(active_only=False)
+            self.durations = {s['id']: s.get('duration_minutes') or DEFAULT_DURATION_MINUTES for s in services}
+        self.barbers_on_shift = max(1, snapshot['barbers_on_shift'])
+        self.entries = {}
+        for row in snapshot['entries']:
+            entry = dict(row)
+            elapsed = entry.pop('elapsed_seconds', None)
+            if entry['status'] == 'in_service' and elapsed is not None:
+                entry['_started_at'] = time.time() - float(elapsed)
+            self.entries[entry['id']] = entry
+        self.day = day.date
+        self.loaded_at = time.monotonic()
+
+    def apply(self, row: Dict):
+        """Merge a walk_in_queue row (from a write or a change event) into the view."""
+        current = self.entries.get(row['id'])
+        if current and STATUS_RANK.get(row['status'], 0) < STATUS_RANK.get(current['status'], 0):
+            return
+        if row['status'] not in OPEN_STATUSES:
+            self.entries.pop(row['id'], None)
+            return
+        entry = {**(current or {}), **row}
+        if entry['status'] == 'in_service' and '_started_at' not in entry:
+            entry['_started_at'] = time.time()
+        self.entries[row['id']] = entry
+
+    def duration(self, entry: Dict) -> int:
+        return self.durations.get(entry.get('service_id'), DEFAULT_DURATION_MINUTES)
+
+    def by_status(self, status: str) -> List[Dict]:
+        return sorted(
+            (e for e in self.entries.values() if e['status'] == status),
+            key=lambda e: e['queue_position']
+        )
+
+    def waiting(self) -> List[Dict]:
+        return self.by_status('waiting')
+
+    def position(self, entry_id: int) -> Optional[int]:
+        for i, entry in enumerate(self.waiting(), start=1):
+            if entry['id'] == entry_id:
+                return i
+        return None
+
+    def eta_minutes(self, entry_id: int) -> Optional[int]:
+        """Minutes until this customer should be seen, spreading work over barbers on shift."""
+        waiting = self.waiting()
+        ahead = next((i for i, e in enumerate(waiting) if e['id'] == entry_id), None)
+        if ahead is None:
+            return None
+        now = time.time()
+        work = sum(
+            max(0.0, self.duration(e) - (now - e['_started_at']) / 60)
+            for e in self.by_status('in_service')
+        )
+        work += sum(self.duration(e) for e in self.by_status('called'))
+        work += sum(self.duration(e) for e in waiting[:ahead])
+        return int(round(work / self.barbers_on_shift))
+
+
+_views: Dict[int, WalkInQueueView] = {}
+
+
+async def get_view(shop_id: int, day: ShopDay, force: bool = False) -> WalkInQueueView:
+    """The shop's view, reloaded from the database if stale or when force is set."""
+    view = _views.setdefault(shop_id, WalkInQueueView(shop_id))
+    await view.ensure_loaded(day, force)
+    return view
+
+
+def _on_queue_event(event):
+    view = _views.get(event.shop_id)
+    if view is not None and view.day is not None:
+        view.apply(event.payload)
+
+
+for _event_type in (QUEUE_JOINED, QUEUE_CALLED, QUEUE_STARTED, QUEUE_COMPLETED, QUEUE_NO_SHOW):
+    subscribe(_event_type, _on_queue_event)
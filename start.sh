@@ -10,8 +10,16 @@ echo "Cleaning up old bot processes..."
 pkill -f "python.*telegram_bot.py" 2>/dev/null || true
 pkill -f "python3.*telegram_bot.py" 2>/dev/null || true
 
-# Wait a moment for processes to fully terminate
-sleep 2
+# Wait until the old processes are gone (at most ~2s) instead of a fixed sleep;
+# the bot itself probes Telegram for a released polling session on startup
+for _ in $(seq 20); do
+    pgrep -f "python.*telegram_bot.py" >/dev/null 2>&1 || break
+    sleep 0.1
+done
+
+# Apply database migrations (idempotent); the bot's writes need the change_events outbox
+echo "Applying database migrations..."
+(cd "$SCRIPT_DIR" && npm run --silent db:migrate) || echo "WARNING: database migrations failed; bot writes will fail until they are applied"
 
 # Start the combined server (handles Telegram bot, MagicMirror, and admin API)
 cd "$SCRIPT_DIR" && node server.js